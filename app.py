@@ -2,24 +2,118 @@
 SignalWire Reporting Dashboard - Flask Backend
 Optimized for high-volume SMS operations (millions of messages)
 """
-from flask import Flask, jsonify, request, send_from_directory, Response
+from flask import Flask, jsonify, request, send_from_directory, Response, g
+from flask.json.provider import DefaultJSONProvider
+from flask_caching import Cache
+from flask_compress import Compress
 from functools import wraps
-from sqlalchemy import func, text, or_
-from sqlalchemy.dialects.postgresql import insert
+from itsdangerous import TimestampSigner, BadSignature
+from whitenoise import WhiteNoise
+from sqlalchemy import func, lambda_stmt, select, text, tuple_
+import atexit
 import datetime
+import hashlib
+import hmac
+import logging
+import logging.handlers
+import orjson
 import os
+import queue
+import re
+import threading
 from datetime import timedelta
+from utils import parse_signalwire_date, signalwire_rate
+
+# ============================================================================
+# LOGGING
+# ============================================================================
+
+# Request handlers only enqueue log records; a listener thread does the
+# actual stream IO so a slow stdout never stalls a worker
+logger = logging.getLogger('swdash')
+# INFO in production, DEBUG when FLASK_ENV=development; LOG_LEVEL overrides
+DEFAULT_LOG_LEVEL = 'DEBUG' if os.getenv('FLASK_ENV') == 'development' else 'INFO'
+logger.setLevel(os.getenv('LOG_LEVEL', DEFAULT_LOG_LEVEL).upper())
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.propagate = False
+_log_listener.start()
+atexit.register(_log_listener.stop)
 
 # ============================================================================
 # APP CONFIGURATION
 # ============================================================================
 
+# Vite emits content-hashed bundles under assets/, so WhiteNoise lets
+# browsers cache them for a year; index.html keeps the default revalidation.
+ASSET_MAX_AGE = 31536000
+
+class ORJSONProvider(DefaultJSONProvider):
+    """jsonify() through orjson - much faster on the large /api/logs_dt
+    payloads, and datetimes are encoded natively (same ISO format as
+    isoformat()). Anything orjson can't handle goes to Flask's default."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__, static_folder='frontend/dist', static_url_path='')
+app.json = ORJSONProvider(app)
+
+# gzip/brotli for JSON and index.html
+Compress(app)
+
+# Hashed bundles are answered by WhiteNoise before the request reaches Flask:
+# file metadata is read once at startup and the .gz/.br siblings written at
+# build time (python -m whitenoise.compress) are served as-is
+app.wsgi_app = WhiteNoise(
+    app.wsgi_app, root=os.path.join(app.static_folder, 'assets'), prefix='assets/',
+    max_age=ASSET_MAX_AGE, immutable_file_test=lambda path, url: True
+)
+
+# Response cache for the dashboard panels. Data isn't per-user (single shared
+# login), so caching by path + query string is safe. Redis is shared across
+# gunicorn workers; the key prefix keeps cache.clear() away from Celery keys.
+REDIS_URL = os.getenv('REDIS_URL') or os.getenv('CELERY_BROKER_URL')
+cache = Cache(app, config={
+    'CACHE_TYPE': 'RedisCache' if REDIS_URL else 'SimpleCache',
+    'CACHE_REDIS_URL': REDIS_URL,
+    'CACHE_KEY_PREFIX': 'swdash:',
+    'CACHE_DEFAULT_TIMEOUT': 30
+})
+STATS_CACHE_TIMEOUT = 30  # seconds
+ALERTS_CACHE_TIMEOUT = 15
+
+def cache_get(key):
+    """cache.get that treats a cache (Redis) error as a miss"""
+    try:
+        return cache.get(key)
+    except Exception:
+        logger.warning("Cache read failed", exc_info=True)
+        return None
+
+def cache_set(key, value, timeout):
+    """cache.set that ignores cache errors; the value is recomputed next time"""
+    try:
+        cache.set(key, value, timeout=timeout)
+    except Exception:
+        logger.warning("Cache write failed", exc_info=True)
 
 # Simple password protection
 DASHBOARD_USER = os.getenv('DASHBOARD_USER', 'admin')
 DASHBOARD_PASS = os.getenv('DASHBOARD_PASS', 'signalwire2025')
 
+# DLR webhooks are acknowledged but dropped unless explicitly enabled
+WEBHOOK_PROCESSING = os.getenv('WEBHOOK_PROCESSING', '0') == '1'
+# Buffer webhooks in Redis for tasks.flush_webhook_batch. Only set this where
+# a Celery beat runs (docker-compose); without one nothing drains the queue,
+# so by default each event is written inline
+WEBHOOK_QUEUE = os.getenv('WEBHOOK_QUEUE', '0') == '1'
+
 # Opt-out keyword lists - TWO SEPARATE METERS
 # Meter 1: Default/Standard opt-out keywords
 DEFAULT_STOP_KEYWORDS = ['stop', 'unsubscribe', 'optout', 'opt-out', 'opt out']
@@ -35,34 +129,73 @@ CUSTOM_STOP_KEYWORDS = [
     'do not contact', 'dnc', 'delete my number'
 ]
 
+def keyword_tsquery(keywords):
+    """
+    Build one tsquery (simple config) matching any of the keywords. Single
+    words match whole lexemes only ("end" doesn't catch "ending"). Multi-word
+    keywords become phrase queries (leave <-> me <-> alone), with a prefix
+    match on a last word of 4+ letters so "wrong number" still catches
+    "wrong numbers". Keywords that normalize to the same lexemes ('opt-out'
+    / 'opt out') appear once.
+    """
+    terms = []
+    for kw in keywords:
+        words = re.findall(r'[a-z0-9]+', kw.lower())
+        if len(words) > 1 and len(words[-1]) >= 4:
+            words[-1] += ':*'
+        if words:
+            terms.append('(' + ' <-> '.join(words) + ')' if len(words) > 1 else words[0])
+    return ' | '.join(dict.fromkeys(terms))
+
+# Pre-built once so each request only binds the query string; matched
+# against the GIN-indexed sms_logs.body_tokens column
+DEFAULT_STOP_TSQUERY = keyword_tsquery(DEFAULT_STOP_KEYWORDS)
+CUSTOM_STOP_TSQUERY = keyword_tsquery(CUSTOM_STOP_KEYWORDS)
+
 # ============================================================================
 # DATABASE CONNECTION
 # ============================================================================
 
 try:
-    from models import Session, SMSLog, get_engine
-    MODELS_AVAILABLE = True
+    from models import Session, SMSLog, get_engine, copy_upsert, refresh_rollups
+    MODELS_AVAILABLE = Session is not None
 except Exception as e:
-    print(f"Warning: Could not import models: {e}")
+    logger.warning("Could not import models: %s", e)
     MODELS_AVAILABLE = False
     Session = None
     SMSLog = None
 
 # Celery is optional
 try:
-    from tasks import process_webhook_event, sync_historical_data, celery
+    from tasks import (process_webhook_event, queue_webhook_event, webhook_record,
+                       upsert_webhook_records, sync_historical_data, celery)
     CELERY_AVAILABLE = True
 except Exception:
     CELERY_AVAILABLE = False
-    print("Celery not available - webhooks will be processed synchronously")
+    logger.warning("Celery not available - webhooks will not be processed")
 
 # ============================================================================
 # AUTHENTICATION
 # ============================================================================
 
+DASHBOARD_USER_B = DASHBOARD_USER.encode()
+DASHBOARD_PASS_B = DASHBOARD_PASS.encode()
+
+# After a successful basic-auth login the browser gets a signed cookie, which
+# later requests present instead. The default key is derived from the
+# credentials, so changing the password invalidates outstanding cookies.
+AUTH_COOKIE = 'sw_dashboard_auth'
+AUTH_COOKIE_MAX_AGE = 12 * 3600  # seconds
+_auth_signer = TimestampSigner(
+    os.getenv('SECRET_KEY') or hashlib.sha256(DASHBOARD_USER_B + b':' + DASHBOARD_PASS_B).hexdigest(),
+    salt='dashboard-auth'
+)
+
 def check_auth(username, password):
-    """Check if username/password combination is valid"""
-    return username == DASHBOARD_USER and password == DASHBOARD_PASS
+    """Check if username/password combination is valid (constant time)"""
+    user_ok = hmac.compare_digest((username or '').encode(), DASHBOARD_USER_B)
+    pass_ok = hmac.compare_digest((password or '').encode(), DASHBOARD_PASS_B)
+    return user_ok and pass_ok
 
 def authenticate():
     """Send 401 response that enables basic auth"""
@@ -71,11 +204,25 @@ def authenticate():
         {'WWW-Authenticate': 'Basic realm="SignalWire Dashboard"'}
     )
 
+def is_authenticated():
+    """Check the signed auth cookie, falling back to basic auth credentials"""
+    token = request.cookies.get(AUTH_COOKIE)
+    if token:
+        try:
+            _auth_signer.unsign(token, max_age=AUTH_COOKIE_MAX_AGE)
+            return True
+        except BadSignature:
+            pass
+    auth = request.authorization
+    if auth and check_auth(auth.username, auth.password):
+        g.issue_auth_cookie = True
+        return True
+    return False
+
 def requires_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth = request.authorization
-        if not auth or not check_auth(auth.username, auth.password):
+        if not is_authenticated():
             return authenticate()
         return f(*args, **kwargs)
     return decorated
@@ -84,17 +231,137 @@ def requires_auth(f):
 # HELPER FUNCTIONS
 # ============================================================================
 
-def keyword_filter(keywords):
-    """Build SQLAlchemy filter for keyword matching"""
-    if not keywords or not MODELS_AVAILABLE:
-        return None
-    filters = [SMSLog.body.ilike(f'%{kw}%') for kw in keywords]
-    return or_(*filters)
+# Misses for the same cached panel are coalesced per process. Hits are served
+# straight from the cache without locking; on a miss the first request takes
+# the lock for that cache key and computes, and concurrent ones wait on it and
+# are then served the entry it filled (the @cache.cached view re-checks the
+# cache inside the lock). Locks live only while someone holds or waits on them.
+_flight_locks = {}
+_flight_guard = threading.Lock()
+
+def single_flight(f):
+    """Wrap a @cache.cached view (applied above it)"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = f.make_cache_key(*args, **kwargs)
+        rv = cache_get(key)
+        if rv is not None:
+            return rv
+        with _flight_guard:
+            entry = _flight_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                return f(*args, **kwargs)
+        finally:
+            with _flight_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del _flight_locks[key]
+    return decorated
+
+def cacheable(rv):
+    """Only cache successful responses (errors are returned as tuples)"""
+    return not isinstance(rv, tuple)
 
 def get_time_window(hours=24):
     """Get datetime for N hours ago"""
     return datetime.datetime.utcnow() - timedelta(hours=hours)
 
+def get_date_range(hours=24):
+    """
+    [start_dt, end_dt) from the start_date/end_date query args (YYYY-MM-DD,
+    end date inclusive). Missing or invalid values default to the last
+    `hours` hours. The clock is read once so both bounds, and every query
+    in the request, share the same "now".
+    """
+    now = datetime.datetime.utcnow()
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    
+    start_dt = now - timedelta(hours=hours)
+    if start_date:
+        try:
+            start_dt = datetime.datetime.strptime(start_date, '%Y-%m-%d')
+        except ValueError:
+            pass
+    
+    end_dt = now
+    if end_date:
+        try:
+            end_dt = datetime.datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+        except ValueError:
+            pass
+    return start_dt, end_dt
+
+def rollup_day_range(start_dt, end_dt):
+    """
+    Whole days inside [start_dt, end_dt) that can be read from a daily rollup.
+    Today is excluded since it is still being written to. Returns an empty
+    range (end_dt, end_dt) when no whole day is covered.
+    """
+    day_start = datetime.datetime.combine(start_dt.date(), datetime.time())
+    if day_start < start_dt:
+        day_start += timedelta(days=1)
+    today = datetime.datetime.combine(datetime.datetime.utcnow().date(), datetime.time())
+    day_end = min(datetime.datetime.combine(end_dt.date(), datetime.time()), today)
+    if day_end <= day_start:
+        return end_dt, end_dt
+    return day_start, day_end
+
+def missing_rollup_days(session, table, day_start, day_end):
+    """
+    Days in [day_start, day_end) without a row in the daily rollup `table`
+    (one of ROLLUP_DAYS_SQL). They haven't been rolled up yet (or had no
+    traffic), so the rollup queries aggregate them from raw rows.
+    """
+    present = set(session.execute(
+        ROLLUP_DAYS_SQL[table], {'day_start': day_start, 'day_end': day_end}
+    ).scalars())
+    first = day_start.date() if isinstance(day_start, datetime.datetime) else day_start
+    last = day_end.date() if isinstance(day_end, datetime.datetime) else day_end
+    return [first + timedelta(days=n) for n in range((last - first).days)
+            if first + timedelta(days=n) not in present]
+
+_relation_cache = {}
+
+# DataTables asks for the same counts on every page turn; kept in the shared
+# response cache so all gunicorn workers reuse one COUNT
+COUNT_CACHE_TTL = 60  # seconds
+
+def estimated_log_count(session):
+    """Planner row estimate for sms_logs; -1 until the table is first analyzed"""
+    return session.execute(text(
+        "SELECT reltuples::bigint FROM pg_class WHERE relname = 'sms_logs'"
+    )).scalar()
+
+def count_cache_key(key):
+    return 'count:' + ':'.join(str(k) for k in key)
+
+def cached_count(key, count_fn):
+    """Return count_fn() memoized under key for COUNT_CACHE_TTL seconds"""
+    cache_key = count_cache_key(key)
+    value = cache_get(cache_key)
+    if value is None:
+        value = count_fn()
+        cache_set(cache_key, value, COUNT_CACHE_TTL)
+    return value
+
+def relation_exists(session, name):
+    """Check (once per process) whether an optional object created by
+    init_db(), such as a rollup table, is present"""
+    if name not in _relation_cache:
+        _relation_cache[name] = session.execute(
+            text("SELECT to_regclass(:name) IS NOT NULL"), {'name': name}
+        ).scalar()
+    return _relation_cache[name]
+
+@app.teardown_appcontext
+def remove_session(exc=None):
+    """Return the request's scoped session connection to the pool"""
+    if MODELS_AVAILABLE and Session is not None:
+        Session.remove()
+
 def check_db():
     """Check database connectivity"""
     if not MODELS_AVAILABLE:
@@ -121,19 +388,43 @@ def index():
         return jsonify({'error': 'Frontend not built', 'details': str(e)}), 500
 
 @app.route('/<path:path>')
-@requires_auth
 def serve_static(path):
     """Serve static files or fallback to React app"""
     # Skip API and webhook routes
     if path.startswith('api/') or path.startswith('webhooks/') or path == 'health':
         return jsonify({'error': 'Not found'}), 404
     
+    # Everything that reaches Flask (including the SPA fallback) requires
+    # login; the hashed bundles are answered by WhiteNoise before this
+    if not is_authenticated():
+        return authenticate()
+    
     try:
         return send_from_directory('frontend/dist', path)
     except:
         # SPA fallback - serve index.html for client-side routing
         return send_from_directory('frontend/dist', 'index.html')
 
+@app.after_request
+def set_auth_cookie(response):
+    """Hand out the signed cookie after a successful basic-auth check"""
+    if g.get('issue_auth_cookie'):
+        response.set_cookie(
+            AUTH_COOKIE, _auth_signer.sign(DASHBOARD_USER).decode(),
+            max_age=AUTH_COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+            secure=request.is_secure
+        )
+    return response
+
+@app.after_request
+def add_api_etag(response):
+    """ETag the polled JSON panels so unchanged data is answered with a 304"""
+    if (request.method == 'GET' and request.path.startswith(('/api/stats/', '/api/alerts'))
+            and response.status_code == 200 and response.is_json):
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
 # ============================================================================
 # HEALTH CHECK (No auth required)
 # ============================================================================
@@ -156,25 +447,264 @@ def health_check():
 def signalwire_webhook():
     """
     Webhook endpoint for SignalWire DLR notifications.
-    NOTE: Keep this DISABLED for now to avoid overwhelming the system.
+    NOTE: Paused unless WEBHOOK_PROCESSING=1. When enabled, payloads are
+    written inline, or with WEBHOOK_QUEUE=1 queued in Redis and written in
+    batches by tasks.flush_webhook_batch.
     """
     if request.method == 'GET':
         return jsonify({
             'status': 'ok',
-            'message': 'Webhook endpoint active (currently paused)',
+            'message': 'Webhook endpoint active' + ('' if WEBHOOK_PROCESSING else ' (currently paused)'),
             'timestamp': datetime.datetime.utcnow().isoformat()
         })
     
-    # For now, just acknowledge without processing
-    # This prevents SignalWire from retrying
+    if WEBHOOK_PROCESSING and CELERY_AVAILABLE:
+        data = request.form.to_dict()
+        queued = False
+        if WEBHOOK_QUEUE:
+            try:
+                queue_webhook_event(data)
+                queued = True
+            except Exception:
+                # Redis is down - don't lose the event, write it inline instead
+                logger.warning("Webhook queue unavailable, writing inline", exc_info=True)
+        if not queued:
+            record = webhook_record(data)
+            if record is not None and MODELS_AVAILABLE:
+                session = Session()
+                try:
+                    upsert_webhook_records(session, [record])
+                except Exception:
+                    session.rollback()
+                    logger.exception("Webhook inline write failed")
+    
+    # Always acknowledge - this prevents SignalWire from retrying
     return '', 200
 
+# ============================================================================
+# SQL STATEMENTS
+# ============================================================================
+# Built once at import so every request reuses the same TextClause and hits
+# SQLAlchemy's compiled cache instead of re-wrapping the SQL string.
+
+# Closed days inside the rollup range that have no rollup row yet (e.g.
+# webhook-only days on a deployment without a beat) are aggregated from raw
+# rows instead, one index range scan per day
+_MISSING_DAYS_SOURCE = """unnest(CAST(:missing_days AS date[])) AS missing(day)
+            JOIN sms_logs ON date_created >= missing.day AND date_created < missing.day + 1"""
+
+_OVERVIEW_AGGREGATES = """
+            COUNT(*) as total,
+            COUNT(*) FILTER (WHERE is_delivered) as delivered,
+            COUNT(*) FILTER (WHERE is_failed) as failed,
+            COALESCE(SUM(price), 0) as spend,
+            hll_add_agg(hll_hash_text(to_number))
+                FILTER (WHERE to_number IS NOT NULL) as h,
+            SUM(EXTRACT(EPOCH FROM (date_sent - date_created)) * 1000)
+                FILTER (WHERE date_sent IS NOT NULL) as latency_sum,
+            COUNT(*) FILTER (WHERE date_sent IS NOT NULL) as latency_n"""
+
+OVERVIEW_ROLLUP_SQL = text(f"""
+    SELECT 
+        SUM(total)::bigint, SUM(delivered)::bigint, SUM(failed)::bigint,
+        SUM(spend), hll_cardinality(hll_union_agg(h)),
+        SUM(latency_sum) / NULLIF(SUM(latency_n), 0)
+    FROM (
+        SELECT {_OVERVIEW_AGGREGATES}
+        FROM sms_logs 
+        WHERE date_created >= :start_dt AND date_created < :end_dt
+          AND (date_created < :day_start OR date_created >= :day_end)
+        UNION ALL
+        SELECT {_OVERVIEW_AGGREGATES}
+        FROM {_MISSING_DAYS_SOURCE}
+        UNION ALL
+        SELECT 
+            SUM(total), SUM(delivered), SUM(failed), SUM(spend),
+            hll_union_agg(h), SUM(latency_sum), SUM(latency_n)
+        FROM sms_daily_hll
+        WHERE d >= :day_start AND d < :day_end
+    ) parts
+""")
+
+OVERVIEW_SQL = text("""
+    SELECT 
+        COUNT(*) as total,
+        COUNT(*) FILTER (WHERE is_delivered) as delivered,
+        COUNT(*) FILTER (WHERE is_failed) as failed,
+        COALESCE(SUM(price), 0) as spend,
+        COUNT(DISTINCT to_number) as segments,
+        AVG(EXTRACT(EPOCH FROM (date_sent - date_created)) * 1000) 
+            FILTER (WHERE date_sent IS NOT NULL) as avg_latency
+    FROM sms_logs 
+    WHERE date_created >= :start_dt AND date_created < :end_dt
+""")
+
+# Each count is its own subquery so its predicate is in a WHERE clause the
+# planner can match to an index: the keyword meters to the partial GIN
+# idx_inbound_body_tokens (bitmap scan over the tsvector), delivered to the
+# partial idx_outbound_delivered. (Inside COUNT(*) FILTER the tsquery would
+# be tested row by row over every row in the window.)
+OPTOUT_SQL = text("""
+    SELECT 
+        (SELECT COUNT(*) FROM sms_logs
+         WHERE direction = 'outbound-api' AND is_delivered
+           AND date_created >= :start_dt AND date_created < :end_dt) as delivered,
+        (SELECT COUNT(*) FROM sms_logs
+         WHERE direction = 'inbound'
+           AND body_tokens @@ to_tsquery('simple', :default_q)
+           AND date_created >= :start_dt AND date_created < :end_dt) as default_count,
+        (SELECT COUNT(*) FROM sms_logs
+         WHERE direction = 'inbound'
+           AND body_tokens @@ to_tsquery('simple', :custom_q)
+           AND date_created >= :start_dt AND date_created < :end_dt) as custom_count
+""")
+
+TIMESERIES_ROLLUP_SQL = text(f"""
+    SELECT 
+        day,
+        SUM(cnt)::bigint as total,
+        COALESCE(SUM(cnt) FILTER (WHERE status IN ('delivered', 'sent')), 0)::bigint as delivered,
+        COALESCE(SUM(cnt) FILTER (WHERE status IN ('failed', 'undelivered')), 0)::bigint as failed
+    FROM (
+        SELECT day, status, cnt
+        FROM sms_daily_rollup
+        WHERE day >= :cutoff_day AND day < :today
+        UNION ALL
+        SELECT DATE(date_created), status, COUNT(*)
+        FROM {_MISSING_DAYS_SOURCE}
+        GROUP BY DATE(date_created), status
+        UNION ALL
+        SELECT DATE(date_created), status, COUNT(*)
+        FROM sms_logs
+        WHERE date_created >= :today
+        GROUP BY DATE(date_created), status
+    ) parts
+    GROUP BY day
+    ORDER BY day
+""")
+
+TIMESERIES_SQL = text("""
+    SELECT 
+        DATE(date_created) as day,
+        COUNT(*) as total,
+        COUNT(*) FILTER (WHERE status IN ('delivered', 'sent')) as delivered,
+        COUNT(*) FILTER (WHERE status IN ('failed', 'undelivered')) as failed
+    FROM sms_logs
+    WHERE date_created >= :cutoff
+    GROUP BY DATE(date_created)
+    ORDER BY day
+""")
+
+LATENCY_SQL = text("""
+    SELECT 
+        percentile_cont(ARRAY[0.50, 0.95, 0.99])
+            WITHIN GROUP (ORDER BY latency_ms) as percentiles,
+        COUNT(*) as samples
+    FROM sms_logs
+    WHERE date_created >= NOW() - INTERVAL '24 hours'
+      AND latency_ms > 0 AND latency_ms < 60000
+""")
+
+# Same percentiles straight from the timestamps, for databases where the
+# latency_ms schema upgrade hasn't been applied
+LATENCY_RAW_SQL = text("""
+    SELECT 
+        percentile_cont(ARRAY[0.50, 0.95, 0.99])
+            WITHIN GROUP (ORDER BY latency_ms) as percentiles,
+        COUNT(*) as samples
+    FROM (
+        SELECT EXTRACT(EPOCH FROM (date_sent - date_created)) * 1000 as latency_ms
+        FROM sms_logs
+        WHERE date_sent IS NOT NULL 
+          AND date_created >= NOW() - INTERVAL '24 hours'
+    ) s
+    WHERE latency_ms > 0 AND latency_ms < 60000
+""")
+
+# The beat recounts every 300s, so buckets older than two periods are stale
+ALERTS_SQL = text("""
+    SELECT 
+        COALESCE(SUM(total), 0) as total,
+        COALESCE(SUM(failed), 0) as failed,
+        COALESCE(MAX(refreshed_at) >= (NOW() AT TIME ZONE 'utc') - INTERVAL '10 minutes', false) as fresh
+    FROM sms_hourly_counters
+    WHERE hour >= :window_hour
+""")
+
+# Exact last-hour counts from sms_logs, used when the counters are stale
+# (idx_date_status_cover for the total, idx_failed_date for the failures)
+ALERTS_RAW_SQL = text("""
+    SELECT 
+        (SELECT COUNT(*) FROM sms_logs WHERE date_created >= :window) as total,
+        (SELECT COUNT(*) FROM sms_logs WHERE is_failed AND date_created >= :window) as failed
+""")
+
+# Outbound delivery by destination prefix (country code) - there is no carrier
+# column, so the routing prefix stands in for the "carrier"
+CARRIER_SQL = text("""
+    SELECT 
+        left(to_number, 2) as prefix,
+        COUNT(*) as volume,
+        COUNT(*) FILTER (WHERE is_delivered) as delivered
+    FROM sms_logs
+    WHERE date_created >= :window
+      AND direction = 'outbound-api'
+      AND to_number IS NOT NULL
+    GROUP BY 1
+    ORDER BY volume DESC
+    LIMIT 20
+""")
+
+_ERROR_STATS_TEMPLATE = """
+    SELECT 
+        error_code,
+        SUM(cnt)::bigint as total,
+        CASE
+            WHEN SUM(cnt) >= 500 THEN 'critical'
+            WHEN SUM(cnt) >= 100 THEN 'high'
+            WHEN SUM(cnt) >= 25 THEN 'medium'
+            ELSE 'low'
+        END as severity
+    FROM (
+        SELECT error_code, COUNT(*) as cnt
+        FROM sms_logs 
+        WHERE error_code IS NOT NULL
+          AND date_created >= :start_dt AND date_created < :end_dt
+          AND (date_created < :day_start OR date_created >= :day_end)
+        GROUP BY error_code{rollup}
+    ) parts
+    GROUP BY error_code
+    ORDER BY total DESC
+    LIMIT 10
+"""
+ERROR_STATS_SQL = text(_ERROR_STATS_TEMPLATE.format(rollup=''))
+ERROR_STATS_ROLLUP_SQL = text(_ERROR_STATS_TEMPLATE.format(rollup=f"""
+        UNION ALL
+        SELECT error_code, COUNT(*)
+        FROM {_MISSING_DAYS_SOURCE}
+        WHERE error_code IS NOT NULL
+        GROUP BY error_code
+        UNION ALL
+        SELECT error_code, cnt
+        FROM sms_daily_errors
+        WHERE day >= :day_start AND day < :day_end"""))
+
+# Days present in a daily rollup table, for missing_rollup_days()
+ROLLUP_DAYS_SQL = {
+    'sms_daily_hll': text("SELECT d FROM sms_daily_hll WHERE d >= :day_start AND d < :day_end"),
+    'sms_daily_rollup': text(
+        "SELECT DISTINCT day FROM sms_daily_rollup WHERE day >= :day_start AND day < :day_end"
+    ),
+}
+
 # ============================================================================
 # API ENDPOINTS (Protected)
 # ============================================================================
 
 @app.route('/api/stats/overview')
 @requires_auth
+@single_flight
+@cache.cached(timeout=STATS_CACHE_TIMEOUT, query_string=True, response_filter=cacheable)
 def get_overview_stats():
     """Main dashboard KPIs with optional date filtering"""
     if not MODELS_AVAILABLE:
@@ -183,38 +713,20 @@ def get_overview_stats():
     session = Session()
     try:
         # Date filtering
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        if start_date:
-            try:
-                start_dt = datetime.datetime.strptime(start_date, '%Y-%m-%d')
-            except:
-                start_dt = get_time_window(24)
-        else:
-            start_dt = get_time_window(24)
+        start_dt, end_dt = get_date_range()
         
-        if end_date:
-            try:
-                end_dt = datetime.datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-            except:
-                end_dt = datetime.datetime.utcnow()
+        if relation_exists(session, 'sms_daily_hll'):
+            # Whole past days come from the daily HLL rollup, only the partial
+            # edges of the window are aggregated from raw rows
+            day_start, day_end = rollup_day_range(start_dt, end_dt)
+            stats = session.execute(OVERVIEW_ROLLUP_SQL, {
+                'start_dt': start_dt, 'end_dt': end_dt,
+                'day_start': day_start, 'day_end': day_end,
+                'missing_days': missing_rollup_days(session, 'sms_daily_hll', day_start, day_end)
+            }).fetchone()
         else:
-            end_dt = datetime.datetime.utcnow()
-        
-        # Use efficient single query with conditional aggregation
-        stats = session.execute(text("""
-            SELECT 
-                COUNT(*) as total,
-                COUNT(*) FILTER (WHERE status IN ('delivered', 'sent')) as delivered,
-                COUNT(*) FILTER (WHERE status IN ('failed', 'undelivered')) as failed,
-                COALESCE(SUM(price), 0) as spend,
-                COUNT(DISTINCT to_number) as segments,
-                AVG(EXTRACT(EPOCH FROM (date_sent - date_created)) * 1000) 
-                    FILTER (WHERE date_sent IS NOT NULL) as avg_latency
-            FROM sms_logs 
-            WHERE date_created >= :start_dt AND date_created < :end_dt
-        """), {'start_dt': start_dt, 'end_dt': end_dt}).fetchone()
+            # Use efficient single query with conditional aggregation
+            stats = session.execute(OVERVIEW_SQL, {'start_dt': start_dt, 'end_dt': end_dt}).fetchone()
         
         total = stats[0] or 0
         delivered = stats[1] or 0
@@ -226,17 +738,17 @@ def get_overview_stats():
             'failed': failed,
             'successRate': round((delivered / total * 100), 2) if total > 0 else 0,
             'spend': round(float(stats[3] or 0), 2),
-            'activeSegments': stats[4] or 0,
+            'activeSegments': int(stats[4] or 0),
             'avgLatency': round(float(stats[5] or 0), 0)
         })
     except Exception as e:
-        print(f"Error in overview stats: {e}")
+        logger.exception("Error in overview stats")
         return jsonify({'error': str(e)}), 500
-    finally:
-        session.close()
 
 @app.route('/api/stats/optouts')
 @requires_auth
+@single_flight
+@cache.cached(timeout=STATS_CACHE_TIMEOUT, query_string=True, response_filter=cacheable)
 def get_optout_stats():
     """
     Two separate opt-out meters with date filtering:
@@ -249,56 +761,19 @@ def get_optout_stats():
     session = Session()
     try:
         # Date filtering
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
+        start_dt, end_dt = get_date_range()
         
-        if start_date:
-            try:
-                start_dt = datetime.datetime.strptime(start_date, '%Y-%m-%d')
-            except:
-                start_dt = get_time_window(24)
-        else:
-            start_dt = get_time_window(24)
+        # Delivered outbound + both keyword meters in one round trip
+        stats = session.execute(OPTOUT_SQL, {
+            'start_dt': start_dt,
+            'end_dt': end_dt,
+            'default_q': DEFAULT_STOP_TSQUERY,
+            'custom_q': CUSTOM_STOP_TSQUERY
+        }).fetchone()
         
-        if end_date:
-            try:
-                end_dt = datetime.datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-            except:
-                end_dt = datetime.datetime.utcnow()
-        else:
-            end_dt = datetime.datetime.utcnow()
-        
-        # Count delivered outbound messages
-        delivered = session.query(func.count(SMSLog.id)).filter(
-            SMSLog.date_created >= start_dt,
-            SMSLog.date_created < end_dt,
-            SMSLog.direction == 'outbound-api',
-            SMSLog.status.in_(['delivered', 'sent'])
-        ).scalar() or 0
-
-        # Meter 1: Default keywords (STOP, UNSUBSCRIBE only)
-        default_filter = keyword_filter(DEFAULT_STOP_KEYWORDS)
-        default_count = 0
-        if default_filter is not None:
-            default_count = session.query(func.count(SMSLog.id)).filter(
-                SMSLog.date_created >= start_dt,
-                SMSLog.date_created < end_dt,
-                SMSLog.direction == 'inbound',
-                SMSLog.body.isnot(None),
-                default_filter
-            ).scalar() or 0
-
-        # Meter 2: Custom keywords (user-defined)
-        custom_filter = keyword_filter(CUSTOM_STOP_KEYWORDS)
-        custom_count = 0
-        if custom_filter is not None:
-            custom_count = session.query(func.count(SMSLog.id)).filter(
-                SMSLog.date_created >= start_dt,
-                SMSLog.date_created < end_dt,
-                SMSLog.direction == 'inbound',
-                SMSLog.body.isnot(None),
-                custom_filter
-            ).scalar() or 0
+        delivered = stats[0] or 0
+        default_count = stats[1] or 0
+        custom_count = stats[2] or 0
 
         return jsonify({
             'delivered': delivered,
@@ -312,13 +787,13 @@ def get_optout_stats():
             'customKeywords': CUSTOM_STOP_KEYWORDS
         })
     except Exception as e:
-        print(f"Error in optout stats: {e}")
+        logger.exception("Error in optout stats")
         return jsonify({'error': str(e)}), 500
-    finally:
-        session.close()
 
 @app.route('/api/stats/errors')
 @requires_auth
+@single_flight
+@cache.cached(timeout=STATS_CACHE_TIMEOUT, query_string=True, response_filter=cacheable)
 def get_error_stats():
     """Top error codes with severity classification and date filtering"""
     if not MODELS_AVAILABLE:
@@ -327,51 +802,42 @@ def get_error_stats():
     session = Session()
     try:
         # Date filtering
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
+        start_dt, end_dt = get_date_range()
         
-        if start_date:
-            try:
-                start_dt = datetime.datetime.strptime(start_date, '%Y-%m-%d')
-            except:
-                start_dt = get_time_window(24)
-        else:
-            start_dt = get_time_window(24)
-        
-        if end_date:
-            try:
-                end_dt = datetime.datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-            except:
-                end_dt = datetime.datetime.utcnow()
+        # Whole past days come from the daily error rollup; severity is
+        # classified in SQL so rows go straight into the response
+        day_start, day_end = rollup_day_range(start_dt, end_dt)
+        if not relation_exists(session, 'sms_daily_errors'):
+            day_start, day_end = end_dt, end_dt  # Scan raw rows only
+        params = {
+            'start_dt': start_dt, 'end_dt': end_dt,
+            'day_start': day_start, 'day_end': day_end
+        }
+        if day_start < day_end:
+            # sms_daily_rollup has a row for every rolled-up day with traffic
+            # (days without errors have none in sms_daily_errors)
+            params['missing_days'] = (
+                missing_rollup_days(session, 'sms_daily_rollup', day_start, day_end)
+                if relation_exists(session, 'sms_daily_rollup') else []
+            )
+            stmt = ERROR_STATS_ROLLUP_SQL
         else:
-            end_dt = datetime.datetime.utcnow()
-        
-        results = session.execute(text("""
-            SELECT error_code, COUNT(*) as cnt
-            FROM sms_logs 
-            WHERE error_code IS NOT NULL
-              AND date_created >= :start_dt AND date_created < :end_dt
-            GROUP BY error_code
-            ORDER BY cnt DESC
-            LIMIT 10
-        """), {'start_dt': start_dt, 'end_dt': end_dt}).fetchall()
-        
-        def get_severity(count):
-            if count >= 500: return 'critical'
-            if count >= 100: return 'high'
-            if count >= 25: return 'medium'
-            return 'low'
+            stmt = ERROR_STATS_SQL
+        results = session.execute(stmt, params).fetchall()
         
         return jsonify([{
             'code': r[0],
             'count': r[1],
-            'severity': get_severity(r[1])
+            'severity': r[2]
         } for r in results])
-    finally:
-        session.close()
+    except Exception as e:
+        logger.exception("Error in error stats")
+        return jsonify([]), 500
 
 @app.route('/api/stats/timeseries')
 @requires_auth
+@single_flight
+@cache.cached(timeout=STATS_CACHE_TIMEOUT, query_string=True, response_filter=cacheable)
 def get_timeseries_stats():
     """Daily message volume for charts"""
     if not MODELS_AVAILABLE:
@@ -379,42 +845,71 @@ def get_timeseries_stats():
     
     session = Session()
     try:
-        cutoff = datetime.datetime.utcnow() - timedelta(days=7)
-        
-        results = session.execute(text("""
-            SELECT 
-                DATE(date_created) as day,
-                status,
-                COUNT(*) as cnt
-            FROM sms_logs
-            WHERE date_created >= :cutoff
-            GROUP BY DATE(date_created), status
-            ORDER BY day
-        """), {'cutoff': cutoff}).fetchall()
-        
-        data = {}
-        for date_val, status, count in results:
-            if not date_val:
-                continue
-            d_str = date_val.strftime('%Y-%m-%d') if hasattr(date_val, 'strftime') else str(date_val)
-            if d_str not in data:
-                data[d_str] = {'delivered': 0, 'failed': 0, 'total': 0}
-            
-            data[d_str]['total'] += count
-            if status in ('delivered', 'sent'):
-                data[d_str]['delivered'] += count
-            elif status in ('failed', 'undelivered'):
-                data[d_str]['failed'] += count
+        now = datetime.datetime.utcnow()
+        cutoff = now - timedelta(days=7)
+        
+        if relation_exists(session, 'sms_daily_rollup'):
+            # Past days from the rollup (raw rows for days it doesn't have
+            # yet), today is counted from raw rows
+            today = datetime.datetime.combine(now.date(), datetime.time())
+            results = session.execute(TIMESERIES_ROLLUP_SQL, {
+                'cutoff_day': cutoff.date(), 'today': today,
+                'missing_days': missing_rollup_days(session, 'sms_daily_rollup', cutoff.date(), today.date())
+            }).fetchall()
+        else:
+            results = session.execute(TIMESERIES_SQL, {'cutoff': cutoff}).fetchall()
+        
+        # One row per day, already split into delivered/failed in SQL. The
+        # date keys are written as YYYY-MM-DD by orjson (OPT_NON_STR_KEYS)
+        data = {
+            date_val: {'delivered': delivered, 'failed': failed, 'total': total}
+            for date_val, total, delivered, failed in results
+            if date_val
+        }
         
         return jsonify(data)
     except Exception as e:
-        print(f"Error in timeseries: {e}")
+        logger.exception("Error in timeseries")
         return jsonify({}), 500
-    finally:
-        session.close()
+
+@app.route('/api/stats/carriers')
+@requires_auth
+@single_flight
+@cache.cached(timeout=STATS_CACHE_TIMEOUT, query_string=True, response_filter=cacheable)
+def get_carrier_stats():
+    """24h delivery rate per destination prefix, aggregated in SQL"""
+    if not MODELS_AVAILABLE:
+        return jsonify([]), 503
+    
+    session = Session()
+    try:
+        results = session.execute(CARRIER_SQL, {'window': get_time_window(24)}).fetchall()
+        
+        carriers = []
+        for prefix, volume, delivered in results:
+            rate = round(delivered / volume * 100, 2) if volume else 0
+            if rate >= 95:
+                status = 'operational'
+            elif rate >= 85:
+                status = 'degraded'
+            else:
+                status = 'critical'
+            carriers.append({
+                'name': prefix,
+                'deliveryRate': rate,
+                'volume': volume,
+                'status': status
+            })
+        
+        return jsonify(carriers)
+    except Exception as e:
+        logger.exception("Error in carrier stats")
+        return jsonify([]), 500
 
 @app.route('/api/stats/latency')
 @requires_auth
+@single_flight
+@cache.cached(timeout=STATS_CACHE_TIMEOUT, query_string=True, response_filter=cacheable)
 def get_latency_stats():
     """Latency percentiles (P50, P95, P99)"""
     if not MODELS_AVAILABLE:
@@ -422,36 +917,24 @@ def get_latency_stats():
     
     session = Session()
     try:
-        # Get latency values efficiently
-        results = session.execute(text("""
-            SELECT 
-                EXTRACT(EPOCH FROM (date_sent - date_created)) * 1000 as latency_ms
-            FROM sms_logs
-            WHERE date_sent IS NOT NULL 
-              AND date_created IS NOT NULL
-              AND date_created >= NOW() - INTERVAL '24 hours'
-            ORDER BY latency_ms
-        """)).fetchall()
-        
-        latencies = [r[0] for r in results if r[0] and 0 < r[0] < 60000]
-        
-        if not latencies:
-            return jsonify({'p50': 0, 'p95': 0, 'p99': 0, 'samples': 0})
+        # Percentiles computed in one aggregation pass, no rows shipped.
+        # idx_latency_date only exists once the latency_ms column does
+        stmt = LATENCY_SQL if relation_exists(session, 'idx_latency_date') else LATENCY_RAW_SQL
+        stats = session.execute(stmt).fetchone()
         
-        latencies.sort()
-        n = len(latencies)
+        percentiles, samples = stats
+        if not samples:
+            return jsonify({'p50': 0, 'p95': 0, 'p99': 0, 'samples': 0})
         
         return jsonify({
-            'p50': round(latencies[int(n * 0.50)], 0),
-            'p95': round(latencies[int(n * 0.95)], 0),
-            'p99': round(latencies[min(int(n * 0.99), n-1)], 0),
-            'samples': n
+            'p50': round(percentiles[0], 0),
+            'p95': round(percentiles[1], 0),
+            'p99': round(percentiles[2], 0),
+            'samples': samples
         })
     except Exception as e:
-        print(f"Error in latency stats: {e}")
+        logger.exception("Error in latency stats")
         return jsonify({'p50': 0, 'p95': 0, 'p99': 0}), 500
-    finally:
-        session.close()
 
 @app.route('/api/logs_dt')
 @requires_auth
@@ -470,82 +953,127 @@ def get_logs_datatable():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        # Build query
-        query = session.query(SMSLog)
-        
         # Apply date filters if provided
+        filters = []
+        start_dt = end_dt = None
         if start_date:
             try:
-                from datetime import datetime
-                start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-                query = query.filter(SMSLog.date_created >= start_dt)
+                start_dt = datetime.datetime.strptime(start_date, '%Y-%m-%d')
+                filters.append(SMSLog.date_created >= start_dt)
             except:
                 pass
         
         if end_date:
             try:
-                from datetime import datetime
                 # Add 1 day to include the end date fully
-                end_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-                query = query.filter(SMSLog.date_created < end_dt)
+                end_dt = datetime.datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+                filters.append(SMSLog.date_created < end_dt)
             except:
                 pass
         
-        # Order and paginate
-        logs = query.order_by(SMSLog.date_created.desc())\
-            .offset(start)\
-            .limit(length)\
-            .all()
+        # Only the columns the table shows, as plain rows (no ORM entities);
+        # the body preview is truncated in SQL. Built as a lambda statement so
+        # the construct and its compiled SQL are cached per code path and
+        # only the bound values change between requests
+        stmt = lambda_stmt(lambda: select(
+            SMSLog.id, SMSLog.date_created, SMSLog.date_sent,
+            SMSLog.to_number, SMSLog.from_number, SMSLog.status,
+            SMSLog.error_code, SMSLog.error_message, SMSLog.direction,
+            func.substr(SMSLog.body, 1, 160).label('body'), SMSLog.price
+        ).order_by(SMSLog.date_created.desc(), SMSLog.id.desc()))
+        if start_dt:
+            stmt += lambda s: s.where(SMSLog.date_created >= start_dt)
+        if end_dt:
+            stmt += lambda s: s.where(SMSLog.date_created < end_dt)
         
-        # Get filtered count
-        total = query.count()
+        # Keyset pagination: with the last row of the previous page
+        # (after_date/after_id, as returned in "next") the page starts right
+        # after it on the (date_created, id) index instead of skipping
+        # `start` rows with OFFSET
+        after_date = request.args.get('after_date')
+        after_id = request.args.get('after_id')
+        keyset = bool(after_date and after_id)
+        if keyset:
+            after_dt = datetime.datetime.fromisoformat(after_date)
+            stmt += lambda s: s.where(tuple_(SMSLog.date_created, SMSLog.id) < tuple_(after_dt, after_id))
+        else:
+            stmt += lambda s: s.offset(start)
+        
+        # A filtered OFFSET page whose count isn't cached yet carries the
+        # count as count(*) OVER () - evaluated before LIMIT/OFFSET, so the
+        # page and its total come back in one pass instead of a second
+        # COUNT query. (Keyset pages would only count rows past the cursor.)
+        count_key = (start_date, end_date)
+        with_total = bool(filters) and not keyset and cache_get(count_cache_key(count_key)) is None
+        if with_total:
+            stmt += lambda s: s.add_columns(func.count().over().label('total_filtered'))
+        stmt += lambda s: s.limit(length)
+        rows = session.execute(stmt).all()
+        if with_total and rows:
+            cache_set(count_cache_key(count_key), rows[0].total_filtered, COUNT_CACHE_TTL)
+        
+        def count_rows():
+            return session.execute(
+                select(func.count()).select_from(SMSLog).where(*filters)
+            ).scalar()
+        
+        # Get filtered count - estimated when unfiltered, cached otherwise
+        if not filters:
+            total = cached_count(('total',), lambda: estimated_log_count(session))
+            if total is None or total < 0:
+                total = cached_count(('exact',), count_rows)
+        else:
+            total = cached_count(count_key, count_rows)
         
         data = [{
-            'id': log.id,
-            'date_created': log.date_created.isoformat() if log.date_created else None,
-            'date_sent': log.date_sent.isoformat() if log.date_sent else None,
-            'to_number': log.to_number,
-            'from_number': log.from_number,
-            'status': log.status,
-            'error_code': log.error_code,
-            'error_message': log.error_message,
-            'direction': log.direction,
-            'body': log.body[:160] if log.body else None,  # Show more of message
-            'price': float(log.price) if log.price else 0
-        } for log in logs]
+            'id': row.id,
+            'date_created': row.date_created,
+            'date_sent': row.date_sent,
+            'to_number': row.to_number,
+            'from_number': row.from_number,
+            'status': row.status,
+            'error_code': row.error_code,
+            'error_message': row.error_message,
+            'direction': row.direction,
+            'body': row.body,
+            'price': float(row.price) if row.price else 0
+        } for row in rows]
         
         return jsonify({
             'draw': draw,
             'recordsTotal': total,
             'recordsFiltered': total,
-            'data': data
+            'data': data,
+            'next': {'after_date': rows[-1].date_created, 'after_id': rows[-1].id} if rows else None
         })
     except Exception as e:
-        print(f"Error in logs_dt: {e}")
+        logger.exception("Error in logs_dt")
         return jsonify({'draw': 1, 'recordsTotal': 0, 'recordsFiltered': 0, 'data': []})
-    finally:
-        session.close()
 
 @app.route('/api/alerts')
 @requires_auth
+@single_flight
+@cache.cached(timeout=ALERTS_CACHE_TIMEOUT, query_string=True, response_filter=cacheable)
 def get_alerts():
     """Generate alerts based on recent activity"""
     if not MODELS_AVAILABLE:
-        return jsonify([])
+        return jsonify([]), 503
     
     session = Session()
     try:
         alerts = []
-        window = get_time_window(1)  # Last hour
+        now = datetime.datetime.utcnow()
+        window = now - timedelta(hours=1)  # Last hour
         
-        # Check failure rate
-        stats = session.execute(text("""
-            SELECT 
-                COUNT(*) as total,
-                COUNT(*) FILTER (WHERE status IN ('failed', 'undelivered')) as failed
-            FROM sms_logs 
-            WHERE date_created >= :window
-        """), {'window': window}).fetchone()
+        # Check failure rate - read from the hour buckets (previous + current
+        # hour) unless nothing has recounted them recently
+        window_hour = window.replace(minute=0, second=0, microsecond=0)
+        stats = session.execute(ALERTS_SQL, {'window_hour': window_hour}).fetchone()
+        if stats[2]:
+            period = f'since {window_hour:%H:%M} UTC'
+        else:
+            stats = session.execute(ALERTS_RAW_SQL, {'window': window}).fetchone()
+            period = 'in last hour'
         
         if stats[0] > 0:
             failure_rate = (stats[1] / stats[0]) * 100
@@ -553,31 +1081,26 @@ def get_alerts():
                 alerts.append({
                     'id': 'high-failure',
                     'severity': 'critical',
-                    'message': f'High failure rate: {failure_rate:.1f}% in last hour',
-                    'timestamp': datetime.datetime.utcnow().isoformat()
+                    'message': f'High failure rate: {failure_rate:.1f}% {period}',
+                    'timestamp': now.isoformat()
                 })
             elif failure_rate > 10:
                 alerts.append({
                     'id': 'elevated-failure',
                     'severity': 'warning',
-                    'message': f'Elevated failure rate: {failure_rate:.1f}% in last hour',
-                    'timestamp': datetime.datetime.utcnow().isoformat()
+                    'message': f'Elevated failure rate: {failure_rate:.1f}% {period}',
+                    'timestamp': now.isoformat()
                 })
         
         return jsonify(alerts)
     except Exception as e:
-        print(f"Error in alerts: {e}")
-        return jsonify([])
-    finally:
-        session.close()
+        logger.exception("Error in alerts")
+        return jsonify([]), 500
 
 # ============================================================================
 # SIGNALWIRE DIRECT FETCH (for real-time data)
 # ============================================================================
 
-import threading
-import time as time_module
-
 # Global sync state for background processing
 sync_state = {
     'running': False,
@@ -591,146 +1114,174 @@ sync_state = {
 }
 sync_lock = threading.Lock()
 
-def background_sync(hours, space, base_url, auth, start_time):
-    """Background sync function that runs in a separate thread"""
-    global sync_state
+def fetch_message_pages(space, base_url, auth, params, pages):
+    """
+    Producer for background_sync: follows next_page_uri over one pooled HTTP
+    session (TLS stays warm between pages) and puts each page's messages on
+    the queue. Puts the exception that stopped it, if any, then None.
+    """
     import requests
+    from requests.adapters import HTTPAdapter
+    
+    http = requests.Session()
+    http.auth = auth
+    http.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
     
     try:
-        all_messages = []
         next_page_uri = None
-        page_count = 0
-        
-        params = {
-            'PageSize': 100,
-            'DateSent>': start_time.strftime('%Y-%m-%d')
-        }
-        
-        # Fetch ALL pages - no limit
         while True:
             with sync_lock:
                 if not sync_state['running']:
                     break  # Cancelled
-                sync_state['progress'] = f'Fetching page {page_count + 1}...'
             
-            try:
-                if next_page_uri:
-                    full_url = f"https://{space}{next_page_uri}"
-                    response = requests.get(full_url, auth=auth, timeout=60)
-                else:
-                    response = requests.get(base_url, auth=auth, params=params, timeout=60)
-                
-                content_type = response.headers.get('content-type', '')
-                if 'application/json' not in content_type:
-                    with sync_lock:
-                        sync_state['error'] = f'SignalWire returned non-JSON response'
-                        sync_state['running'] = False
-                    return
-                
-                response.raise_for_status()
-                data = response.json()
-                
-            except Exception as e:
-                with sync_lock:
-                    sync_state['error'] = f'API error: {str(e)}'
-                    sync_state['running'] = False
-                return
+            signalwire_rate.acquire()
+            if next_page_uri:
+                response = http.get(f"https://{space}{next_page_uri}", timeout=60)
+            else:
+                response = http.get(base_url, params=params, timeout=60)
+            
+            content_type = response.headers.get('content-type', '')
+            if 'application/json' not in content_type:
+                raise RuntimeError('SignalWire returned non-JSON response')
+            
+            response.raise_for_status()
+            data = orjson.loads(response.content)
             
             messages = data.get('messages', [])
             if not messages:
                 break
-            
-            all_messages.extend(messages)
-            page_count += 1
-            
-            with sync_lock:
-                sync_state['pages'] = page_count
-                sync_state['fetched'] = len(all_messages)
-                sync_state['progress'] = f'Fetched {len(all_messages):,} messages from {page_count} pages...'
+            pages.put(messages)
             
             next_page_uri = data.get('next_page_uri')
             if not next_page_uri:
                 break
-            
-            # Small delay to avoid rate limiting
-            time_module.sleep(0.1)
+    except Exception as e:
+        pages.put(e)
+    finally:
+        pages.put(None)
+        http.close()
+
+def save_messages(messages):
+    """
+    COPY SignalWire message dicts into sms_logs with ON CONFLICT DO NOTHING;
+    rows that already exist are skipped by Postgres. Returns (inserted, rows).
+    """
+    rows = []
+    for msg in messages:
+        try:
+            rows.append({
+                'id': msg['sid'],
+                'date_created': parse_signalwire_date(msg.get('date_created')),
+                'date_sent': parse_signalwire_date(msg.get('date_sent')),
+                'to_number': msg.get('to'),
+                'from_number': msg.get('from'),
+                'status': (msg.get('status') or 'unknown').lower(),
+                'error_code': int(msg['error_code']) if msg.get('error_code') else None,
+                'error_message': msg.get('error_message'),
+                'direction': msg.get('direction'),
+                'body': msg.get('body'),
+                'price': float(msg['price']) if msg.get('price') else 0
+            })
+        except Exception as e:
+            logger.warning("Error parsing message: %s", e)
+    
+    if not rows:
+        return 0, 0
+    return copy_upsert(rows, []), len(rows)
+
+def background_sync(hours, space, base_url, auth, start_time):
+    """
+    Background sync function that runs in a separate thread.
+    Pages are fetched by a producer thread while this thread writes the
+    previous ones to the database, so API and DB latency overlap.
+    """
+    global sync_state
+    
+    try:
+        params = {
+            'PageSize': 100,
+            'DateSent>': start_time.strftime('%Y-%m-%d')
+        }
         
-        # Now save to database
-        with sync_lock:
-            sync_state['progress'] = f'Saving {len(all_messages):,} messages to database...'
+        # Bounded so a slow database applies backpressure to the fetcher
+        pages = queue.Queue(maxsize=20)
+        fetcher = threading.Thread(
+            target=fetch_message_pages,
+            args=(space, base_url, auth, params, pages),
+            daemon=True
+        )
+        fetcher.start()
         
+        page_count = 0
+        fetched_count = 0
         saved_count = 0
         skipped_count = 0
+        api_error = None
+        fetch_done = False
+        batch_size = 1000
+        pending = []
         
-        # Helper function to parse SignalWire date format (RFC 2822)
-        def parse_signalwire_date(date_str):
-            if not date_str:
-                return None
-            try:
-                from email.utils import parsedate_to_datetime
-                return parsedate_to_datetime(date_str)
-            except:
-                try:
-                    return datetime.datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                except:
-                    return None
-        
-        if MODELS_AVAILABLE and all_messages:
-            session = Session()
-            try:
-                # Process in batches of 500
-                batch_size = 500
-                for i in range(0, len(all_messages), batch_size):
-                    batch = all_messages[i:i+batch_size]
-                    sids = [msg['sid'] for msg in batch]
-                    existing_ids = set(
-                        row[0] for row in session.query(SMSLog.id).filter(SMSLog.id.in_(sids)).all()
-                    )
-                    
-                    for msg in batch:
-                        if msg['sid'] in existing_ids:
-                            skipped_count += 1
-                            continue
-                        
-                        try:
-                            log = SMSLog(
-                                id=msg['sid'],
-                                date_created=parse_signalwire_date(msg.get('date_created')),
-                                date_sent=parse_signalwire_date(msg.get('date_sent')),
-                                to_number=msg.get('to'),
-                                from_number=msg.get('from'),
-                                status=msg.get('status'),
-                                error_code=int(msg['error_code']) if msg.get('error_code') else None,
-                                error_message=msg.get('error_message'),
-                                direction=msg.get('direction'),
-                                body=msg.get('body'),
-                                price=float(msg['price']) if msg.get('price') else 0
-                            )
-                            session.add(log)
-                            saved_count += 1
-                        except Exception as e:
-                            print(f"Error parsing message: {e}")
-                    
-                    session.commit()
-                    
-                    with sync_lock:
-                        sync_state['saved'] = saved_count
-                        sync_state['skipped'] = skipped_count
-                        sync_state['progress'] = f'Saved {saved_count:,} messages ({i + len(batch):,}/{len(all_messages):,})...'
-                    
-            except Exception as e:
-                session.rollback()
+        try:
+            while True:
+                item = pages.get()
+                if item is None:
+                    fetch_done = True
+                    break
+                if isinstance(item, Exception):
+                    api_error = item
+                    continue  # Drain until the fetcher's final None
+                
+                page_count += 1
+                fetched_count += len(item)
+                pending.extend(item)
+                
+                # Save in batches as pages arrive
+                if MODELS_AVAILABLE and len(pending) >= batch_size:
+                    inserted, rows = save_messages(pending)
+                    saved_count += inserted
+                    skipped_count += rows - inserted
+                    pending = []
+                
                 with sync_lock:
-                    sync_state['error'] = f'Database error: {str(e)}'
-            finally:
-                session.close()
+                    sync_state['pages'] = page_count
+                    sync_state['fetched'] = fetched_count
+                    sync_state['saved'] = saved_count
+                    sync_state['skipped'] = skipped_count
+                    sync_state['progress'] = f'Fetched {fetched_count:,} messages from {page_count} pages, saved {saved_count:,}...'
+            
+            if MODELS_AVAILABLE and pending:
+                inserted, rows = save_messages(pending)
+                saved_count += inserted
+                skipped_count += rows - inserted
+        except Exception as e:
+            with sync_lock:
+                sync_state['error'] = f'Database error: {str(e)}'
+                sync_state['running'] = False  # Stop the fetcher
+            # Let the fetcher finish so it isn't left blocked on a full queue
+            while not fetch_done:
+                fetch_done = pages.get() is None
+        
+        if api_error is not None:
+            with sync_lock:
+                sync_state['error'] = f'API error: {str(api_error)}'
+                sync_state['running'] = False
+            return
+        
+        if MODELS_AVAILABLE and fetched_count:
+            with sync_lock:
+                sync_state['progress'] = 'Refreshing rollups...'
+            refresh_rollups(since=start_time)
+            
+            # Drop cached panels so the dashboard shows the new data
+            with app.app_context():
+                cache.clear()
         
         with sync_lock:
             sync_state['complete'] = True
             sync_state['running'] = False
             sync_state['saved'] = saved_count
             sync_state['skipped'] = skipped_count
-            sync_state['progress'] = f'Complete! Fetched {len(all_messages):,}, saved {saved_count:,} new messages.'
+            sync_state['progress'] = f'Complete! Fetched {fetched_count:,}, saved {saved_count:,} new messages.'
             
     except Exception as e:
         with sync_lock:
@@ -886,8 +1437,9 @@ def get_db_stats():
             'oldest_message': oldest.isoformat() if oldest else None,
             'newest_message': newest.isoformat() if newest else None
         })
-    finally:
-        session.close()
+    except Exception as e:
+        logger.exception("Error in db stats")
+        return jsonify({'error': str(e)}), 500
 
 # ============================================================================
 # STARTUP
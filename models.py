@@ -1,7 +1,12 @@
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Float, Index, text
+from sqlalchemy import create_engine, Column, String, Integer, BigInteger, DateTime, Float, Index, func, select, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import NullPool
+import csv
+import io
 import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -37,19 +42,20 @@ class SMSLog(Base):
 
     # Indexes for high-performance reporting
     __table_args__ = (
-        # Compound index for the most common query: "Status count by date"
-        Index('idx_date_status', 'date_created', 'status'),
-        # Index for error reporting
-        Index('idx_error_code', 'error_code'),
+        # Compound index for the most common query: "Status count by date".
+        # Covers id/to_number too so the windowed counts are index-only scans
+        Index('idx_date_status_cover', 'date_created', 'status',
+              postgresql_include=['id', 'to_number']),
         # Index for fast lookups by phone number
         Index('idx_to_number', 'to_number'),
     )
 
     def to_dict(self):
+        # datetimes are left as-is; the orjson provider serializes them natively
         return {
             'id': self.id,
-            'date_created': self.date_created.isoformat() if self.date_created else None,
-            'date_sent': self.date_sent.isoformat() if self.date_sent else None,
+            'date_created': self.date_created,
+            'date_sent': self.date_sent,
             'to_number': self.to_number,
             'from_number': self.from_number,
             'status': self.status,
@@ -59,6 +65,18 @@ class SMSLog(Base):
             'body': self.body
         }
 
+class SMSHourlyCounter(Base):
+    """Per-hour totals recounted by sync, the beat and webhook writes; read by /api/alerts"""
+    __tablename__ = 'sms_hourly_counters'
+
+    hour = Column(DateTime, primary_key=True)
+    total = Column(BigInteger, nullable=False, server_default='0')
+    failed = Column(BigInteger, nullable=False, server_default='0')
+    # When the bucket was last recounted (UTC); /api/alerts falls back to raw
+    # rows when nothing has refreshed the counters recently. The default here
+    # stays portable for create_all(); SCHEMA_UPGRADES sets the UTC one
+    refreshed_at = Column(DateTime, nullable=False, server_default=func.now())
+
 # Database Connection
 # We use environment variables for connection string to work with Docker
 DATABASE_URL = os.getenv('DATABASE_URL', 'postgresql://user:password@db:5432/signalwire_db')
@@ -71,13 +89,35 @@ def get_engine():
     """Get or create database engine (lazy initialization)"""
     global _engine
     if _engine is None:
+        connect_args = {}
+        if DATABASE_URL.startswith('postgres'):  # libpq options; not for e.g. a local SQLite file
+            connect_args['connect_timeout'] = 10  # 10 second timeout
+            statement_timeout = os.getenv('DB_STATEMENT_TIMEOUT_MS')
+            if statement_timeout:
+                connect_args['options'] = f'-c statement_timeout={int(statement_timeout)}'
+        
+        if os.getenv('USE_PGBOUNCER'):
+            # DATABASE_URL points at PgBouncer in transaction mode, which does
+            # the pooling; holding connections here as well would pin one
+            # server connection per worker thread. (psycopg2 doesn't use
+            # server-side prepared statements, so transaction mode is safe.)
+            pool_args = {'poolclass': NullPool}
+        else:
+            pool_args = {
+                'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),  # Reduced for Railway
+                'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 5)),
+                'pool_pre_ping': True,
+                # Recycle before server/pooler idle timeouts
+                'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+                # Hand out the most recently used connection so a few stay
+                # hot and the rest can age out instead of all idling warm
+                'pool_use_lifo': True,
+            }
         try:
             _engine = create_engine(
-                DATABASE_URL,
-                pool_size=10,  # Reduced for Railway
-                max_overflow=5,
-                pool_pre_ping=True,
-                connect_args={'connect_timeout': 10}  # 10 second timeout
+                DATABASE_URL, connect_args=connect_args,
+                query_cache_size=1200,  # compiled-SQL cache entries kept per engine
+                **pool_args
             )
         except Exception as e:
             print(f"Error creating database engine: {e}")
@@ -85,17 +125,21 @@ def get_engine():
     return _engine
 
 def get_session():
-    """Get or create session factory (lazy initialization)"""
+    """
+    Get or create the thread-local session registry (lazy initialization).
+    Session() returns the current thread's session; the Flask app calls
+    Session.remove() at the end of each request.
+    """
     global _Session
     if _Session is None:
-        _Session = sessionmaker(bind=get_engine())
+        # Rows are read-only once committed here, so skip the reload on access
+        _Session = scoped_session(sessionmaker(bind=get_engine(), expire_on_commit=False))
     return _Session
 
-# For backward compatibility
-def Session():
-    return get_session()()
-
-# Create engine and session on first import (but handle errors gracefully)
+# One engine and session registry per process. create_engine() doesn't
+# connect, so this only fails on a malformed DATABASE_URL / missing driver;
+# the import still succeeds (tasks.py and sync_logs.py import models
+# unguarded) and importers check for Session being None
 try:
     engine = get_engine()
     Session = get_session()
@@ -105,12 +149,433 @@ except Exception as e:
     engine = None
     Session = None
 
+# PostgreSQL objects that create_all() can't express (extensions, operator-class
+# indexes, ...). Every statement is idempotent so init_db() can be re-run
+# against an existing database to pick up new ones. init_db() is a one-shot
+# release step (railway_start.py, `python models.py`), never run on import:
+# the column additions rewrite sms_logs, so they must not run once per
+# worker at boot. Indexes on sms_logs are built/dropped CONCURRENTLY so
+# writes keep flowing while they build.
+SCHEMA_UPGRADES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # Tokenized body for opt-out keyword matching (body_tokens @@ tsquery)
+    """ALTER TABLE sms_logs ADD COLUMN IF NOT EXISTS body_tokens tsvector
+       GENERATED ALWAYS AS (to_tsvector('simple', coalesce(body, ''))) STORED""",
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_inbound_body_tokens ON sms_logs
+       USING GIN (body_tokens) WHERE direction = 'inbound'""",
+    # Superseded by idx_inbound_body_tokens
+    "DROP INDEX CONCURRENTLY IF EXISTS idx_inbound_body_trgm",
+    # BRIN summary of the append-only time column; tiny compared to a B-tree.
+    # 32 pages per range keeps hour-sized windows selective
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_date_brin ON sms_logs
+       USING BRIN (date_created) WITH (pages_per_range = 32)""",
+    # Superseded by idx_date_brin (default 128 pages per range)
+    "DROP INDEX CONCURRENTLY IF EXISTS idx_date_created_brin",
+    # Partial indexes matching the dashboard predicates
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_inbound_date ON sms_logs (date_created)
+       WHERE direction = 'inbound' AND body IS NOT NULL""",
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_errors_date_code ON sms_logs (date_created)
+       INCLUDE (error_code) WHERE error_code IS NOT NULL""",
+    # Superseded by the covering idx_errors_date_code / idx_date_status_cover
+    "DROP INDEX CONCURRENTLY IF EXISTS idx_errors_date",
+    "DROP INDEX CONCURRENTLY IF EXISTS idx_error_code",
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_date_status_cover ON sms_logs (date_created, status)
+       INCLUDE (id, to_number)""",
+    "DROP INDEX CONCURRENTLY IF EXISTS idx_date_status",
+    # Keyset pagination order for /api/logs_dt (date_created DESC, id DESC)
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_date_id ON sms_logs (date_created, id)",
+    # Statuses are stored lowercase by every ingest path; fold any legacy
+    # mixed-case rows once, then enforce it so plain IN (...) comparisons
+    # (and the status-keyed indexes) always match
+    """DO $$
+       BEGIN
+           IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'sms_logs_status_lower') THEN
+               UPDATE sms_logs SET status = lower(status) WHERE status <> lower(status);
+               ALTER TABLE sms_logs ADD CONSTRAINT sms_logs_status_lower CHECK (status = lower(status));
+           END IF;
+       END $$""",
+    # Status buckets as stored booleans so filters are a single equality
+    """ALTER TABLE sms_logs ADD COLUMN IF NOT EXISTS is_delivered boolean
+       GENERATED ALWAYS AS (status IN ('delivered', 'sent')) STORED""",
+    """ALTER TABLE sms_logs ADD COLUMN IF NOT EXISTS is_failed boolean
+       GENERATED ALWAYS AS (status IN ('failed', 'undelivered')) STORED""",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_failed_date ON sms_logs (date_created) WHERE is_failed",
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_outbound_delivered ON sms_logs (date_created)
+       WHERE direction = 'outbound-api' AND is_delivered""",
+    # Superseded by idx_outbound_delivered
+    "DROP INDEX CONCURRENTLY IF EXISTS idx_outbound_delivered_date",
+    # Send latency stored once per row; the latency panel reads it from a
+    # covering partial index instead of subtracting timestamps per query.
+    # Gaps outside 0..1 day (scheduled sends, late DLRs, date_created that
+    # fell back to "now") are NULL - they aren't send latency, and a plain
+    # ::integer cast overflows past ~24.8 days, failing the whole write.
+    # The first version had that unbounded cast; replace it where present
+    """DO $$
+       BEGIN
+           IF EXISTS (SELECT 1 FROM information_schema.columns
+                      WHERE table_name = 'sms_logs' AND column_name = 'latency_ms'
+                        AND position('CASE' IN upper(generation_expression)) = 0) THEN
+               ALTER TABLE sms_logs DROP COLUMN latency_ms;
+           END IF;
+       END $$""",
+    """ALTER TABLE sms_logs ADD COLUMN IF NOT EXISTS latency_ms integer
+       GENERATED ALWAYS AS (
+           CASE WHEN date_sent - date_created BETWEEN interval '0' AND interval '1 day'
+                THEN (EXTRACT(EPOCH FROM (date_sent - date_created)) * 1000)::integer
+           END
+       ) STORED""",
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_latency_date ON sms_logs (date_created)
+       INCLUDE (latency_ms) WHERE latency_ms > 0 AND latency_ms < 60000""",
+    """ALTER TABLE sms_hourly_counters ADD COLUMN IF NOT EXISTS refreshed_at timestamp
+       NOT NULL DEFAULT (now() AT TIME ZONE 'utc')""",
+    # create_all() gives new tables the portable now() default
+    "ALTER TABLE sms_hourly_counters ALTER COLUMN refreshed_at SET DEFAULT (now() AT TIME ZONE 'utc')",
+    # Daily rollups of closed (UTC) days. Plain tables rather than
+    # materialized views so a refresh only recomputes the days that changed
+    # (see refresh_daily_rollups) instead of re-aggregating the full history;
+    # views left by earlier deploys are dropped and re-seeded by init_db()
+    """DO $$
+       DECLARE rel text;
+       BEGIN
+           FOREACH rel IN ARRAY ARRAY['sms_daily_hll', 'sms_daily_rollup', 'sms_daily_errors'] LOOP
+               IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass(rel) AND relkind = 'm') THEN
+                   EXECUTE format('DROP MATERIALIZED VIEW %I', rel);
+               END IF;
+           END LOOP;
+       END $$""",
+    # KPI rollup with a HyperLogLog sketch of recipients, so the overview can
+    # estimate distinct segments without hashing every to_number
+    "CREATE EXTENSION IF NOT EXISTS hll",
+    """CREATE TABLE IF NOT EXISTS sms_daily_hll (
+           d date PRIMARY KEY,
+           h hll,
+           total bigint NOT NULL,
+           delivered bigint NOT NULL,
+           failed bigint NOT NULL,
+           spend double precision NOT NULL,
+           latency_sum numeric,
+           latency_n bigint NOT NULL
+       )""",
+    # Per-day, per-status counts backing the timeseries chart
+    """CREATE TABLE IF NOT EXISTS sms_daily_rollup (
+           day date NOT NULL,
+           status varchar(20) NOT NULL,
+           cnt bigint NOT NULL,
+           spend double precision NOT NULL,
+           latency_sum numeric,
+           latency_n bigint NOT NULL,
+           PRIMARY KEY (day, status)
+       )""",
+    # Per-day error code counts backing the top-errors panel
+    """CREATE TABLE IF NOT EXISTS sms_daily_errors (
+           day date NOT NULL,
+           error_code integer NOT NULL,
+           cnt bigint NOT NULL,
+           PRIMARY KEY (day, error_code)
+       )""",
+]
+
+# Daily rollup tables: name -> (day column, aggregate over the rows in
+# {source}, grouped by day). {source} is sms_logs restricted to the days
+# being recomputed.
+DAILY_ROLLUPS = {
+    'sms_daily_hll': ('d', """
+        SELECT
+            DATE(date_created),
+            hll_add_agg(hll_hash_text(to_number)) FILTER (WHERE to_number IS NOT NULL),
+            COUNT(*),
+            COUNT(*) FILTER (WHERE status IN ('delivered', 'sent')),
+            COUNT(*) FILTER (WHERE status IN ('failed', 'undelivered')),
+            COALESCE(SUM(price), 0),
+            SUM(EXTRACT(EPOCH FROM (date_sent - date_created)) * 1000)
+                FILTER (WHERE date_sent IS NOT NULL),
+            COUNT(*) FILTER (WHERE date_sent IS NOT NULL)
+        FROM {source}
+        GROUP BY 1"""),
+    'sms_daily_rollup': ('day', """
+        SELECT
+            DATE(date_created),
+            status,
+            COUNT(*),
+            COALESCE(SUM(price), 0),
+            SUM(EXTRACT(EPOCH FROM (date_sent - date_created)) * 1000)
+                FILTER (WHERE date_sent IS NOT NULL),
+            COUNT(*) FILTER (WHERE date_sent IS NOT NULL)
+        FROM {source}
+        GROUP BY 1, 2"""),
+    'sms_daily_errors': ('day', """
+        SELECT DATE(date_created), error_code, COUNT(*)
+        FROM {source}
+        WHERE error_code IS NOT NULL
+        GROUP BY 1, 2"""),
+}
+
+# One index range scan per day instead of a DATE() filter over the table
+_ROLLUP_SOURCE = """unnest(CAST(:days AS date[])) AS days(day)
+            JOIN sms_logs ON date_created >= days.day AND date_created < days.day + 1"""
+
+# Closed days re-rolled on every refresh_rollups() call, so late status
+# updates (and the day that just closed) are picked up without a full sync
+ROLLUP_RECENT_DAYS = 2
+
+def apply_schema_upgrades(eng):
+    """Run SCHEMA_UPGRADES in autocommit mode (CREATE INDEX CONCURRENTLY can't
+    run inside a transaction block); each statement commits on its own so one
+    failure (e.g. missing extension privileges) doesn't block the rest"""
+    with eng.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        # An interrupted concurrent build leaves an INVALID index behind,
+        # which IF NOT EXISTS would then skip forever; drop it to rebuild
+        invalid = conn.execute(text("""
+            SELECT indexrelid::regclass::text FROM pg_index
+            WHERE indrelid = to_regclass('sms_logs') AND NOT indisvalid
+        """)).scalars().all()
+        for index in invalid:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index}"))
+        
+        for statement in SCHEMA_UPGRADES:
+            try:
+                conn.execute(text(statement))
+            except Exception as e:
+                first_line = statement.strip().splitlines()[0]
+                print(f"Warning: schema upgrade failed ({first_line}): {e}")
+
+def refresh_daily_rollups(days, tables=None):
+    """Recompute the rows of the daily rollups (all of DAILY_ROLLUPS, or just
+    `tables`) for `days` (dates) from sms_logs. Today is skipped: it is still
+    being written to and the dashboard reads it from raw rows. Tables that
+    don't exist yet are skipped."""
+    today = datetime.utcnow().date()
+    days = sorted({d for d in days if d < today})
+    if not days:
+        return
+    eng = get_engine()
+    for table in tables or DAILY_ROLLUPS:
+        day_column, select_sql = DAILY_ROLLUPS[table]
+        try:
+            with eng.begin() as conn:
+                exists = conn.execute(
+                    text("SELECT to_regclass(:name) IS NOT NULL"), {'name': table}
+                ).scalar()
+                if not exists:
+                    continue
+                conn.execute(text(f"DELETE FROM {table} WHERE {day_column} = ANY(:days)"), {'days': days})
+                conn.execute(
+                    text(f"INSERT INTO {table} {select_sql.format(source=_ROLLUP_SOURCE)}"),
+                    {'days': days}
+                )
+        except Exception as e:
+            print(f"Warning: could not refresh {table}: {e}")
+
+def seed_daily_rollups(eng):
+    """Roll up every closed day once for rollup tables that are still empty
+    (first deploy, or just replacing the old materialized views)"""
+    with eng.connect() as conn:
+        empty = [
+            table for table in DAILY_ROLLUPS
+            if conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': table}).scalar()
+            and not conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {table})")).scalar()
+        ]
+        if not empty:
+            return
+        days = conn.execute(text("SELECT DISTINCT DATE(date_created) FROM sms_logs")).scalars().all()
+    print(f"Seeding {', '.join(empty)} for {len(days)} days...")
+    refresh_daily_rollups(days, tables=empty)
+
+def refresh_hourly_counters(hours_back=2):
+    """Recount the most recent hour buckets of sms_hourly_counters from sms_logs"""
+    since = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours_back - 1)
+    try:
+        with get_engine().begin() as conn:
+            conn.execute(text("""
+                INSERT INTO sms_hourly_counters (hour, total, failed, refreshed_at)
+                SELECT date_trunc('hour', date_created), COUNT(*), COUNT(*) FILTER (WHERE is_failed),
+                       now() AT TIME ZONE 'utc'
+                FROM sms_logs
+                WHERE date_created >= :since
+                GROUP BY 1
+                ON CONFLICT (hour) DO UPDATE
+                    SET total = EXCLUDED.total, failed = EXCLUDED.failed,
+                        refreshed_at = EXCLUDED.refreshed_at
+            """), {'since': since})
+    except Exception as e:
+        print(f"Warning: could not refresh hourly counters: {e}")
+
+# Columns written by the API backfill paths, in COPY order
+COPY_COLUMNS = ['id', 'date_created', 'date_sent', 'to_number', 'from_number', 'status',
+                'error_code', 'error_message', 'direction', 'price', 'body']
+
+def copy_upsert(records, update_columns):
+    """
+    Bulk upsert for backfills: COPY the rows into a per-transaction temp
+    table (no WAL, no per-row statement), then merge them with a single
+    INSERT ... SELECT ... ON CONFLICT (id) DO UPDATE of update_columns
+    for rows where any of them changed (DO NOTHING when update_columns is
+    empty). Returns the number of rows inserted or updated.
+    """
+    if not records:
+        return 0
+    
+    # A page boundary can repeat a SID, and ON CONFLICT can't update the
+    # same row twice in one statement; keep the last occurrence of each
+    records = {record['id']: record for record in records}.values()
+    
+    if get_engine().dialect.name != 'postgresql':
+        return _mapping_upsert(list(records), update_columns)
+    
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for record in records:
+        writer.writerow(['\\N' if record.get(col) is None else record.get(col) for col in COPY_COLUMNS])
+    buf.seek(0)
+    
+    cols = ', '.join(COPY_COLUMNS)
+    if update_columns:
+        # Rows whose update columns all match are left alone, so a re-sync
+        # of unchanged history writes no new row versions (WAL, vacuum)
+        current = ', '.join(f'sms_logs.{col}' for col in update_columns)
+        excluded = ', '.join(f'EXCLUDED.{col}' for col in update_columns)
+        on_conflict = ('DO UPDATE SET ' + ', '.join(f'{col} = EXCLUDED.{col}' for col in update_columns)
+                       + f' WHERE ({current}) IS DISTINCT FROM ({excluded})')
+    else:
+        on_conflict = 'DO NOTHING'
+    conn = get_engine().raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"CREATE TEMP TABLE sms_logs_stage ON COMMIT DROP AS SELECT {cols} FROM sms_logs WITH NO DATA")
+        cur.copy_expert(f"COPY sms_logs_stage ({cols}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
+        cur.execute(f"""
+            INSERT INTO sms_logs ({cols})
+            SELECT {cols} FROM sms_logs_stage
+            ON CONFLICT (id) {on_conflict}
+        """)
+        affected = cur.rowcount
+        conn.commit()
+        return affected
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _comparable(value, python_type):
+    """An incoming value as it reads back from its column: aware datetimes as
+    naive UTC, API strings such as error codes as the column's type"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    if value is not None and python_type in (int, float, str) and not isinstance(value, python_type):
+        try:
+            return python_type(value)
+        except ValueError:
+            pass
+    return value
+
+def _mapping_upsert(records, update_columns):
+    """
+    copy_upsert for databases without COPY or ON CONFLICT (e.g. a local
+    SQLite file): look up which ids already exist, bulk-insert the rest and
+    bulk-update update_columns on the existing ones where any of them
+    changed, skipping the ORM unit of work. Returns the number of rows
+    inserted or updated, as the PostgreSQL path does.
+    """
+    # Its own session: the caller may be using this thread's scoped Session
+    session = sessionmaker(bind=get_engine())()
+    try:
+        columns = [getattr(SMSLog, col) for col in update_columns]
+        types = [column.type.python_type for column in columns]
+        existing = {
+            row[0]: tuple(row[1:]) for row in session.execute(
+                select(SMSLog.id, *columns).where(SMSLog.id.in_([record['id'] for record in records]))
+            )
+        }
+        inserts = [{col: record.get(col) for col in COPY_COLUMNS}
+                   for record in records if record['id'] not in existing]
+        updates = [
+            dict({col: record.get(col) for col in update_columns}, id=record['id'])
+            for record in records
+            if update_columns and record['id'] in existing
+            and tuple(_comparable(record.get(col), python_type)
+                      for col, python_type in zip(update_columns, types)) != existing[record['id']]
+        ]
+        session.bulk_insert_mappings(SMSLog, inserts, render_nulls=True)
+        session.bulk_update_mappings(SMSLog, updates)
+        session.commit()
+        return len(inserts) + len(updates)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+@contextmanager
+def advisory_lock(lock_id):
+    """
+    Hold a session-level Postgres advisory lock for the duration of the
+    block, on a connection of its own. Yields False (without waiting) when
+    another session already holds it. The lock is released when the block
+    exits or, if the process dies, when its connection closes. Behind
+    PgBouncer in transaction mode a session lock isn't pinned to one server
+    connection, so point DATABASE_URL at Postgres (or a session-mode pool)
+    for jobs that rely on it.
+    """
+    conn = get_engine().raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (lock_id,))
+        acquired = cur.fetchone()[0]
+        conn.commit()  # don't sit idle in transaction while the job runs
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (lock_id,))
+                conn.commit()
+    finally:
+        conn.close()
+
+def refresh_rollups(since=None):
+    """
+    Bring the reporting rollups up to date after new data lands: the hourly
+    counters, plus the daily rollups for the closed days from `since` (a date
+    or datetime; the day before is included, since messages can be created a
+    day before they are sent) and the last ROLLUP_RECENT_DAYS.
+    """
+    refresh_hourly_counters()
+    today = datetime.utcnow().date()
+    first = today - timedelta(days=ROLLUP_RECENT_DAYS)
+    if since is not None:
+        since = since.date() if isinstance(since, datetime) else since
+        first = min(first, since - timedelta(days=1))
+    refresh_daily_rollups([first + timedelta(days=n) for n in range((today - first).days)])
+
+# pg advisory lock key held while init_db() runs
+SCHEMA_LOCK_ID = 8675310
+
 def init_db():
-    """Initialize database tables"""
+    """
+    Create the tables and apply SCHEMA_UPGRADES. Run once per deploy, before
+    the web/worker processes start; a concurrent run (another replica
+    starting) is skipped.
+    """
     try:
         eng = get_engine()
-        Base.metadata.create_all(eng)
+        if eng.dialect.name != 'postgresql':
+            # SCHEMA_UPGRADES (and the lock) are PostgreSQL-only
+            Base.metadata.create_all(eng)
+            print("Database initialized successfully!")
+            return
+        with advisory_lock(SCHEMA_LOCK_ID) as acquired:
+            if not acquired:
+                print("Schema upgrade already running elsewhere, skipping")
+                return
+            Base.metadata.create_all(eng)
+            apply_schema_upgrades(eng)
+            seed_daily_rollups(eng)
         print("Database initialized successfully!")
     except Exception as e:
         print(f"Error initializing database: {e}")
         raise
+
+if __name__ == '__main__':
+    init_db()
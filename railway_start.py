@@ -6,13 +6,31 @@ import sys
 # Get port from environment or default to 5000
 port = os.getenv('PORT', '5000')
 
-print(f"Starting Gunicorn on port {port}...")
+# Requests are mostly waiting on Postgres, so each worker serves them from a
+# thread pool; keep workers * threads within the DB pool (DB_POOL_SIZE +
+# DB_MAX_OVERFLOW per worker)
+workers = os.getenv('WEB_CONCURRENCY', '2')
+threads = os.getenv('WEB_THREADS', '8')
+
+# Schema upgrades run here, once, before gunicorn forks - not in every worker
+# at import. Set SKIP_SCHEMA_UPGRADES=1 to leave them to a separate release
+# command (`python models.py`)
+if os.getenv('SKIP_SCHEMA_UPGRADES') != '1':
+    try:
+        from models import init_db
+        init_db()
+    except Exception as e:
+        print(f"Warning: database initialization failed, starting anyway: {e}")
+
+print(f"Starting Gunicorn on port {port} ({workers} workers x {threads} threads)...")
 
 # Start gunicorn
 os.execvp('gunicorn', [
     'gunicorn',
     '--bind', f'0.0.0.0:{port}',
-    '--workers', '2',
+    '--workers', workers,
+    '--worker-class', 'gthread',
+    '--threads', threads,
     '--timeout', '120',
     'app:app'
 ])
@@ -12,13 +12,16 @@ Usage:
 
 import os
 import sys
-import time
-import argparse
 import signal
+import orjson
 import requests
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
+from utils import parse_signalwire_date, signalwire_rate
 
 # Load environment variables
 load_dotenv()
@@ -28,6 +31,24 @@ PROJECT_ID = os.getenv('SIGNALWIRE_PROJECT_ID')
 AUTH_TOKEN = os.getenv('SIGNALWIRE_AUTH_TOKEN')
 SPACE_URL = os.getenv('SIGNALWIRE_SPACE_URL')
 
+# One keep-alive session for every API call, so paging through a long sync
+# reuses the TLS connection instead of handshaking per page. Timeouts and
+# 429/5xx responses are retried by urllib3 with backoff (Retry-After is
+# honored for 429s)
+SESSION = requests.Session()
+SESSION.auth = HTTPBasicAuth(PROJECT_ID, AUTH_TOKEN)
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET'],
+        raise_on_status=False
+    )
+))
+
 def print_config():
     """Print current configuration (masked for security)"""
     print("\n=== CONFIGURATION ===")
@@ -66,12 +87,12 @@ def get_api_base_url():
 def api_request(endpoint, params=None):
     """Make authenticated request to SignalWire API"""
     url = f"{get_api_base_url()}{endpoint}"
-    auth = HTTPBasicAuth(PROJECT_ID, AUTH_TOKEN)
     
     try:
-        response = requests.get(url, auth=auth, params=params, timeout=120)  # 2 minute timeout
+        signalwire_rate.acquire()
+        response = SESSION.get(url, params=params, timeout=120)  # 2 minute timeout
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
     except requests.exceptions.HTTPError as e:
         print(f"❌ API Error: {e}")
         print(f"   Response: {e.response.text if e.response else 'No response'}")
@@ -104,29 +125,29 @@ def test_connection():
         print("✅ Connection successful, but no messages found in account.")
         return True
 
-def get_db_session():
-    """Get database session"""
+def database_available():
+    """Check that the database is reachable (save_batch writes through
+    copy_upsert, so no session is kept open here)"""
     try:
-        from models import Session
-        return Session()
+        from models import get_engine
+        from sqlalchemy import text
+        with get_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
     except Exception as e:
         print(f"❌ Failed to connect to database: {e}")
-        return None
+        return False
 
-def parse_signalwire_date(date_str):
-    """Parse SignalWire date string to datetime"""
-    if not date_str:
-        return None
+def fetch_next_page(next_page_uri, page):
+    """Fetch a page by its next_page_uri (retries happen in SESSION)"""
+    url = f"https://{SPACE_URL.replace('https://', '').replace('http://', '')}{next_page_uri}"
     try:
-        # SignalWire format: "Mon, 25 Nov 2024 12:34:56 +0000"
-        from email.utils import parsedate_to_datetime
-        return parsedate_to_datetime(date_str)
-    except:
-        try:
-            # Fallback ISO format
-            return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            return None
+        signalwire_rate.acquire()
+        response = SESSION.get(url, timeout=120)
+        return orjson.loads(response.content) if response.ok else None
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        print(f"\n   ❌ Page {page} failed: {e}")
+        return None
 
 def sync_messages(hours=24, days=None):
     """
@@ -136,10 +157,6 @@ def sync_messages(hours=24, days=None):
         hours: Number of hours to look back (default 24)
         days: Number of days to look back (overrides hours if set)
     """
-    from models import SMSLog
-    from sqlalchemy.dialects.postgresql import insert
-    import pytz
-    
     # Calculate time window (use timezone-aware datetime)
     if days:
         lookback = timedelta(days=days)
@@ -148,7 +165,7 @@ def sync_messages(hours=24, days=None):
         lookback = timedelta(hours=hours)
         period_desc = f"{hours} hour(s)"
     
-    start_time = datetime.now(pytz.UTC) - lookback
+    start_time = datetime.now(timezone.utc) - lookback
     # Format for SignalWire API: YYYY-MM-DD
     start_date_str = start_time.strftime('%Y-%m-%d')
     
@@ -156,16 +173,14 @@ def sync_messages(hours=24, days=None):
     print(f"   Start date: {start_date_str}")
     print(f"   Looking for messages after: {start_time.isoformat()}Z")
     
-    # Get database session
-    session = get_db_session()
-    if not session:
+    if not database_available():
         return False
     
     # Track progress
     total_fetched = 0
     total_saved = 0
     batch = []
-    batch_size = 100
+    batch_size = 1000
     page = 0
     
     # Handle Ctrl+C gracefully
@@ -178,40 +193,25 @@ def sync_messages(hours=24, days=None):
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
+    prefetch = ThreadPoolExecutor(max_workers=1)
+    
     try:
         print(f"\n🔄 Fetching messages from SignalWire...")
         
-        next_page_uri = None
+        # First page - filter on the exact start datetime so the server
+        # drops the rest of the boundary day; fall back to the date-only
+        # form if the API rejects it (the client-side check below still
+        # trims that day)
+        params = {
+            'PageSize': 100,
+            'DateSent>': start_time.strftime('%Y-%m-%dT%H:%M:%SZ')
+        }
+        result = api_request("/Messages.json", params=params)
+        if result is None:
+            params['DateSent>'] = start_date_str
+            result = api_request("/Messages.json", params=params)
         
         while not stop_requested:
-            # Build request params
-            if next_page_uri:
-                # Use the next page URI directly with retry logic
-                url = f"https://{SPACE_URL.replace('https://', '').replace('http://', '')}{next_page_uri}"
-                auth = HTTPBasicAuth(PROJECT_ID, AUTH_TOKEN)
-                
-                # Retry up to 3 times on timeout
-                for attempt in range(3):
-                    try:
-                        response = requests.get(url, auth=auth, timeout=120)
-                        result = response.json() if response.ok else None
-                        break
-                    except requests.exceptions.ReadTimeout:
-                        if attempt < 2:
-                            print(f"\n   ⏳ Timeout on page {page+1}, retrying ({attempt+2}/3)...")
-                            time.sleep(2)
-                        else:
-                            print(f"\n   ❌ Page {page+1} timed out after 3 attempts")
-                            result = None
-                            break
-            else:
-                # First page - use date filter
-                params = {
-                    'PageSize': 100,
-                    'DateSent>': start_date_str
-                }
-                result = api_request("/Messages.json", params=params)
-            
             if result is None:
                 print("❌ Failed to fetch messages")
                 break
@@ -222,43 +222,52 @@ def sync_messages(hours=24, days=None):
             if not messages:
                 break
             
+            # Fetch the next page while this one is parsed and saved, so the
+            # API round trip overlaps the database write (one page ahead)
+            next_page = prefetch.submit(fetch_next_page, next_page_uri, page + 2) if next_page_uri else None
+            
             page += 1
             
             for msg in messages:
                 if stop_requested:
                     break
                 
-                # Parse dates
                 date_created = parse_signalwire_date(msg.get('date_created'))
-                date_sent = parse_signalwire_date(msg.get('date_sent'))
                 
                 # Skip if before our start time (API filter is by date, not datetime)
                 # Make comparison timezone-aware
                 if date_created:
                     # Ensure both datetimes are comparable (both aware or both naive)
                     if date_created.tzinfo is None:
-                        import pytz
-                        date_created = pytz.UTC.localize(date_created)
+                        date_created = date_created.replace(tzinfo=timezone.utc)
                     if date_created < start_time:
                         continue
                 
+                # Only rows inside the window get the rest of their fields parsed
+                date_sent = parse_signalwire_date(msg.get('date_sent'))
                 total_fetched += 1
                 
                 # Parse error code
-                error_code = None
-                if msg.get('error_code'):
+                error_code = msg.get('error_code')
+                if error_code:
                     try:
-                        error_code = int(msg.get('error_code'))
+                        error_code = int(error_code)
                     except:
-                        pass
+                        error_code = None
+                else:
+                    error_code = None
                 
                 # Parse price
-                price = 0.0
-                if msg.get('price'):
+                price = msg.get('price')
+                if price:
                     try:
-                        price = abs(float(msg.get('price')))
+                        price = abs(float(price))
                     except:
-                        pass
+                        price = 0.0
+                else:
+                    price = 0.0
+                
+                body = msg.get('body')
                 
                 # Create record for upsert
                 record = {
@@ -267,34 +276,36 @@ def sync_messages(hours=24, days=None):
                     'date_sent': date_sent,
                     'to_number': msg.get('to'),
                     'from_number': msg.get('from'),
-                    'status': msg.get('status'),
+                    'status': (msg.get('status') or 'unknown').lower(),
                     'error_code': error_code,
                     'error_message': msg.get('error_message'),
                     'direction': msg.get('direction'),
                     'price': price,
-                    'body': msg.get('body')[:500] if msg.get('body') else None
+                    'body': body[:500] if body else None
                 }
                 batch.append(record)
                 
                 # Save batch when full
                 if len(batch) >= batch_size:
-                    saved = save_batch(session, batch, SMSLog)
+                    saved = save_batch(batch)
                     total_saved += saved
                     batch = []
                     print(f"   Page {page}: Processed {total_fetched} messages, saved {total_saved}...", end='\r')
             
-            # Small delay between pages to respect rate limits
-            time.sleep(0.1)
-            
             # No more pages
-            if not next_page_uri:
+            if next_page is None:
                 break
+            result = next_page.result()
         
         # Save any remaining records
         if batch:
-            saved = save_batch(session, batch, SMSLog)
+            saved = save_batch(batch)
             total_saved += saved
         
+        # Fold the new rows into the reporting rollups
+        from models import refresh_rollups
+        refresh_rollups(since=start_time)
+        
         print(f"\n\n✅ Sync complete!")
         print(f"   Pages fetched: {page}")
         print(f"   Total fetched: {total_fetched}")
@@ -309,44 +320,39 @@ def sync_messages(hours=24, days=None):
         return False
         
     finally:
-        session.close()
+        prefetch.shutdown(wait=False)
 
-def save_batch(session, records, SMSLog):
-    """Save a batch of records using upsert"""
+def save_batch(records):
+    """Save a batch of records using a COPY-staged upsert"""
     if not records:
         return 0
     
     try:
-        from sqlalchemy.dialects.postgresql import insert
+        from models import copy_upsert
         
-        stmt = insert(SMSLog).values(records)
-        do_update = stmt.on_conflict_do_update(
-            index_elements=['id'],
-            set_={
-                'status': stmt.excluded.status,
-                'error_code': stmt.excluded.error_code,
-                'error_message': stmt.excluded.error_message,
-                'date_sent': stmt.excluded.date_sent,
-                'price': stmt.excluded.price
-            }
-        )
-        session.execute(do_update)
-        session.commit()
+        copy_upsert(records, ['status', 'error_code', 'error_message', 'date_sent', 'price'])
         return len(records)
         
     except Exception as e:
-        session.rollback()
         print(f"\n⚠️  Batch save error: {e}")
         return 0
 
-def main():
+def parse_args():
+    """Command line options; the plain `sync_logs.py` run (cron) skips argparse"""
+    if len(sys.argv) == 1:
+        from types import SimpleNamespace
+        return SimpleNamespace(hours=24, days=None, test=False, debug=False)
+    
+    import argparse
     parser = argparse.ArgumentParser(description='Sync SignalWire messages to database')
     parser.add_argument('--hours', type=int, default=24, help='Hours to look back (default: 24)')
     parser.add_argument('--days', type=int, help='Days to look back (overrides --hours)')
     parser.add_argument('--test', action='store_true', help='Test connection only')
     parser.add_argument('--debug', action='store_true', help='Show debug info')
-    
-    args = parser.parse_args()
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
     
     print("=" * 50)
     print("   SIGNALWIRE MESSAGE SYNC")
@@ -372,11 +378,9 @@ def main():
     
     # Test database connection
     print("\n🔍 Testing database connection...")
-    session = get_db_session()
-    if not session:
+    if not database_available():
         sys.exit(1)
     print("✅ Database connection successful!")
-    session.close()
     
     # Run sync
     success = sync_messages(hours=args.hours, days=args.days)
@@ -1,10 +1,18 @@
+import json
 import os
+import redis
+import threading
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from operator import attrgetter
 from celery import Celery
 from signalwire.rest import Client as SignalWireClient
-from models import Session, SMSLog, init_db
+from models import (Session, SMSLog, copy_upsert, advisory_lock, refresh_hourly_counters,
+                    refresh_daily_rollups, refresh_rollups as refresh_all_rollups)
+from sqlalchemy import func, or_
 from sqlalchemy.dialects.postgresql import insert
+from utils import parse_signalwire_date, signalwire_rate
 
 # Configuration
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
@@ -12,95 +20,169 @@ CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:63
 
 celery = Celery('tasks', broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
 
-# Ensure DB is ready (mostly for the worker process)
-# In production, migrations (Alembic) should handle this.
-try:
-    init_db()
-except Exception:
-    pass # Flask app might have initialized it or DB not ready yet
+# Webhook ingest and long historical backfills run on separate queues so a
+# multi-hour sync can't sit in front of fresh DLRs (see docker-compose: one
+# worker per queue, the sync worker with prefetch 1)
+celery.conf.task_routes = {
+    'tasks.process_webhook_event': {'queue': 'webhooks'},
+    'tasks.flush_webhook_batch': {'queue': 'webhooks'},
+    'tasks.sync_historical_data': {'queue': 'sync'},
+}
+
+# Periodic jobs (run the worker with --beat, or a separate `celery beat`)
+celery.conf.beat_schedule = {
+    'refresh-rollups': {
+        'task': 'tasks.refresh_rollups',
+        'schedule': 300.0,  # every 5 minutes
+    },
+    'flush-webhooks': {
+        'task': 'tasks.flush_webhook_batch',
+        'schedule': 1.0,
+    },
+}
+
+_sw_client = None
+_sw_client_lock = threading.Lock()
 
 def get_sw_client():
-    project_id = os.getenv('SIGNALWIRE_PROJECT_ID')
-    token = os.getenv('SIGNALWIRE_AUTH_TOKEN')
-    space = os.getenv('SIGNALWIRE_SPACE_URL')
-    return SignalWireClient(project_id, token, signalwire_space_url=space)
+    """One SignalWire client per worker process, so its HTTP session (and
+    kept-alive TLS connections) carry over from task to task"""
+    global _sw_client
+    with _sw_client_lock:
+        if _sw_client is None:
+            project_id = os.getenv('SIGNALWIRE_PROJECT_ID')
+            token = os.getenv('SIGNALWIRE_AUTH_TOKEN')
+            space = os.getenv('SIGNALWIRE_SPACE_URL')
+            _sw_client = SignalWireClient(project_id, token, signalwire_space_url=space)
+    return _sw_client
+
+# Statuses that mean the carrier has handed the message off
+SENT_STATUSES = frozenset(('sent', 'delivered', 'failed', 'undelivered'))
+
+def webhook_record(data):
+    """
+    Map a SignalWire DLR webhook payload to an sms_logs row.
+    SignalWire uses Twilio-compatible webhook format (form-encoded).
+    Keys: MessageSid, MessageStatus, From, To, ErrorCode, ErrorMessage, etc.
+    Returns None when the payload has no message SID.
+    """
+    message_sid = data.get('MessageSid') or data.get('SmsSid')
+    if not message_sid:
+        return None
+    
+    # Parse status - normalize to lowercase for consistency
+    status = (data.get('MessageStatus') or data.get('SmsStatus') or 'unknown').lower()
+    
+    # Parse error code if present
+    error_code = None
+    error_code_str = data.get('ErrorCode') or data.get('SmsErrorCode')
+    if error_code_str:
+        try:
+            error_code = int(error_code_str)
+        except (ValueError, TypeError):
+            pass
+    
+    # Parse timestamps if available; "now" is read once per event
+    now = datetime.utcnow()
+    
+    # SignalWire/Twilio format: "Mon, 1 Jan 2024 12:00:00 +0000"
+    date_created = parse_signalwire_date(data.get('DateCreated')) or now
+    
+    # Set date_sent if status indicates sent
+    date_sent = now if status in SENT_STATUSES else None
+    
+    return {
+        'id': message_sid,
+        'status': status,
+        'to_number': data.get('To'),
+        'from_number': data.get('From'),
+        'date_created': date_created,
+        'date_sent': date_sent,
+        'error_code': error_code,
+        'error_message': data.get('ErrorMessage') or data.get('SmsErrorMessage'),
+        'direction': data.get('Direction', 'outbound-api'),
+        'body': data.get('Body') or data.get('MessageBody')
+    }
+
+# Built once: executed with a list of parameter dicts, so the SQL is compiled
+# once per process and psycopg2 sends the rows as multi-row VALUES pages,
+# rather than a new .values(records) construct being compiled per batch size
+_webhook_insert = insert(SMSLog)
+
+# Update columns on conflict (upsert). Replayed DLRs that change nothing
+# are skipped by the WHERE, so they don't write a new row version
+WEBHOOK_UPSERT = _webhook_insert.on_conflict_do_update(
+    index_elements=['id'],
+    set_={
+        'status': _webhook_insert.excluded.status,
+        'error_code': _webhook_insert.excluded.error_code,
+        'error_message': _webhook_insert.excluded.error_message,
+        'date_sent': func.coalesce(_webhook_insert.excluded.date_sent, SMSLog.date_sent)
+    },
+    where=or_(
+        SMSLog.status.is_distinct_from(_webhook_insert.excluded.status),
+        SMSLog.error_code.is_distinct_from(_webhook_insert.excluded.error_code)
+    )
+)
+
+# Minimum seconds between rollup refreshes triggered by webhook writes
+WEBHOOK_ROLLUP_INTERVAL = 30
+_rollups_refreshed = 0.0
+_rollups_lock = threading.Lock()
+# Days whose rows changed since the last refresh, and the last closed day
+# this process has rolled up
+_dirty_days = set()
+_closed_day = None
+
+def _utc_date(value):
+    return (value.astimezone(timezone.utc) if value.tzinfo else value).date()
+
+def refresh_webhook_rollups(records):
+    """
+    Fold webhook writes into the rollups, at most once per
+    WEBHOOK_ROLLUP_INTERVAL: the alert window's hour buckets, the closed
+    days that received late status updates, and yesterday once the day
+    has closed.
+    """
+    global _rollups_refreshed, _closed_day
+    with _rollups_lock:
+        _dirty_days.update(_utc_date(r['date_created']) for r in records)
+        now = time.monotonic()
+        if now - _rollups_refreshed < WEBHOOK_ROLLUP_INTERVAL:
+            return
+        _rollups_refreshed = now
+        days = set(_dirty_days)
+        _dirty_days.clear()
+        yesterday = datetime.now(timezone.utc).date() - timedelta(days=1)
+        if _closed_day != yesterday:
+            days.add(yesterday)
+            _closed_day = yesterday
+    refresh_hourly_counters()
+    refresh_daily_rollups(days)
+
+def upsert_webhook_records(session, records):
+    """Upsert webhook_record() rows in one round trip; a later status for the same SID wins"""
+    session.execute(WEBHOOK_UPSERT, records)
+    session.commit()
+    # Status changes move rows in and out of the failed counts, and there is
+    # no beat on Railway to refresh the rollups the dashboard reads
+    refresh_webhook_rollups(records)
 
 @celery.task(bind=True, max_retries=3)
 def process_webhook_event(self, data):
     """
     Handles real-time status updates from SignalWire DLR Webhooks.
-    SignalWire uses Twilio-compatible webhook format (form-encoded).
-    Keys: MessageSid, MessageStatus, From, To, ErrorCode, ErrorMessage, etc.
     """
+    if Session is None:
+        raise self.retry(exc=RuntimeError("database unavailable"), countdown=60)
     session = Session()
     try:
-        message_sid = data.get('MessageSid') or data.get('SmsSid')
-        if not message_sid:
+        record = webhook_record(data)
+        if record is None:
             print("Warning: Webhook missing MessageSid")
             return
         
-        # Parse status - normalize to lowercase for consistency
-        status = (data.get('MessageStatus') or data.get('SmsStatus') or 'unknown').lower()
-        
-        # Parse error code if present
-        error_code = None
-        error_code_str = data.get('ErrorCode') or data.get('SmsErrorCode')
-        if error_code_str:
-            try:
-                error_code = int(error_code_str)
-            except (ValueError, TypeError):
-                pass
-        
-        # Parse timestamps if available
-        date_created = datetime.utcnow()  # Default to now
-        date_sent = None
-        
-        # Try to parse DateCreated if provided
-        date_created_str = data.get('DateCreated')
-        if date_created_str:
-            try:
-                # SignalWire/Twilio format: "Mon, 1 Jan 2024 12:00:00 +0000"
-                # Try parsing with datetime first (simpler, no extra dependency)
-                from datetime import datetime as dt_parse
-                # If that fails, try dateutil (if available)
-                try:
-                    date_created = dt_parse.strptime(date_created_str, '%a, %d %b %Y %H:%M:%S %z')
-                except:
-                    # Fallback to simple parsing
-                    date_created = datetime.utcnow()
-            except:
-                pass
-        
-        # Set date_sent if status indicates sent
-        if status in ['sent', 'delivered', 'failed', 'undelivered']:
-            date_sent = datetime.utcnow()
-        
-        stmt = insert(SMSLog).values(
-            id=message_sid,
-            status=status,
-            to_number=data.get('To'),
-            from_number=data.get('From'),
-            date_created=date_created,
-            date_sent=date_sent,
-            error_code=error_code,
-            error_message=data.get('ErrorMessage') or data.get('SmsErrorMessage'),
-            direction=data.get('Direction', 'outbound-api'),
-            body=data.get('Body') or data.get('MessageBody')
-        )
-        
-        # Update columns on conflict (upsert)
-        do_update_stmt = stmt.on_conflict_do_update(
-            index_elements=['id'],
-            set_={
-                'status': stmt.excluded.status,
-                'error_code': stmt.excluded.error_code,
-                'error_message': stmt.excluded.error_message,
-                'date_sent': stmt.excluded.date_sent
-            }
-        )
-
-        session.execute(do_update_stmt)
-        session.commit()
+        upsert_webhook_records(session, [record])
         
     except Exception as exc:
         session.rollback()
@@ -110,90 +192,180 @@ def process_webhook_event(self, data):
     finally:
         session.close()
 
+# Burst traffic: the webhook endpoint appends payloads to a Redis list and
+# flush_webhook_batch drains it on a short beat interval, so thousands of
+# DLRs become a handful of multi-row upserts instead of one commit each
+WEBHOOK_QUEUE_KEY = 'swdash:webhook_queue'
+WEBHOOK_BATCH_SIZE = 5000
+
+_redis = None
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(CELERY_BROKER_URL)
+    return _redis
+
+def queue_webhook_event(data):
+    """Buffer a webhook payload for the next flush_webhook_batch run"""
+    get_redis().rpush(WEBHOOK_QUEUE_KEY, json.dumps(data))
+
+@celery.task
+def flush_webhook_batch():
+    """Upsert up to WEBHOOK_BATCH_SIZE queued webhook payloads in one statement"""
+    if Session is None:
+        # No database (models failed to initialize); leave the queue intact
+        return 0
+    r = get_redis()
+    pipe = r.pipeline()  # MULTI/EXEC: read and trim atomically
+    pipe.lrange(WEBHOOK_QUEUE_KEY, 0, WEBHOOK_BATCH_SIZE - 1)
+    pipe.ltrim(WEBHOOK_QUEUE_KEY, WEBHOOK_BATCH_SIZE, -1)
+    payloads, _ = pipe.execute()
+    if not payloads:
+        return 0
+    
+    # ON CONFLICT can't touch the same row twice in one statement, so keep
+    # only the latest event per SID (the list is in arrival order)
+    records = {}
+    for payload in payloads:
+        record = webhook_record(json.loads(payload))
+        if record is not None:
+            records[record['id']] = record
+    if not records:
+        return 0
+    
+    session = Session()
+    try:
+        upsert_webhook_records(session, list(records.values()))
+    except Exception as exc:
+        session.rollback()
+        print(f"Webhook batch error: {exc}")
+        # Put the batch back at the head of the queue for the next run
+        r.lpush(WEBHOOK_QUEUE_KEY, *reversed(payloads))
+        return 0
+    finally:
+        session.close()
+    return len(records)
+
+# pg advisory lock key held for the whole of a historical sync
+SYNC_LOCK_ID = 8675309
+
+# Day slices of a historical sync fetched concurrently; they share the
+# process-wide SignalWire token bucket
+SYNC_WORKERS = 3
+
+# Reads every field of an SDK message resource in one C-level call, instead
+# of a Python attribute lookup (and property call) per field; status and
+# price are each read once
+_message_fields = attrgetter('sid', 'date_created', 'date_sent', 'to', 'from_', 'status',
+                             'error_code', 'error_message', 'direction', 'price', 'body')
+
+def sync_time_slice(start, end=None):
+    """
+    Stream the messages sent on the UTC dates [start, end) (open-ended when
+    end is None) into bulk_upsert batches. Returns the number of messages fetched.
+    """
+    client = get_sw_client()
+    batch = []
+    batch_size = 1000
+    count = 0
+    
+    # Use stream() which handles pagination automatically
+    # SignalWire rate limit: ~10 requests/second
+    for msg in client.messages.stream(date_sent_after=start, date_sent_before=end):
+        sid, date_created, date_sent, to, from_, status, error_code, error_message, \
+            direction, price, body = _message_fields(msg)
+        batch.append({
+            'id': sid,
+            'date_created': date_created,
+            'date_sent': date_sent,
+            'to_number': to,
+            'from_number': from_,
+            'status': status.lower() if status else 'unknown',
+            'error_code': error_code,
+            'error_message': error_message,
+            'direction': direction,
+            'price': float(price) if price else 0.0,
+            'body': body
+        })
+        count += 1
+        
+        # Rate limiting: one token per page (the SDK streams 50 per page)
+        if count % 50 == 0:
+            signalwire_rate.acquire()
+        
+        if len(batch) >= batch_size:
+            bulk_upsert(batch)
+            batch = []
+    
+    if batch:
+        bulk_upsert(batch)
+    return count
+
 @celery.task(bind=True, max_retries=5)
 def sync_historical_data(self, days_back=30, minutes_back=None):
     """
     Background job to backfill data from SignalWire API.
-    Handles pagination and rate limits properly.
+    Handles pagination and rate limits properly. Multi-day ranges are split
+    into UTC calendar-day slices that are fetched SYNC_WORKERS at a time.
     
     Args:
         days_back: Number of days to sync (if minutes_back not specified)
         minutes_back: Number of minutes to sync (takes precedence)
     """
-    client = get_sw_client()
-    session = Session()
-    
-    # Calculate date range
-    if minutes_back:
-        start_date = datetime.utcnow() - timedelta(minutes=minutes_back)
-        print(f"Starting sync for past {minutes_back} minutes...")
-    else:
-        start_date = datetime.utcnow() - timedelta(days=days_back)
-        print(f"Starting historical sync for past {days_back} days...")
-    
-    try:
-        # Use stream() which handles pagination automatically
-        # SignalWire rate limit: ~10 requests/second
-        batch = []
-        batch_size = 1000
-        count = 0
+    # Two overlapping backfills would upsert every row twice; a second
+    # trigger while one is running is a no-op
+    with advisory_lock(SYNC_LOCK_ID) as acquired:
+        if not acquired:
+            print("Sync already running, skipping")
+            return 'already running'
         
-        for msg in client.messages.stream(date_sent_after=start_date):
-            record = {
-                'id': msg.sid,
-                'date_created': msg.date_created,
-                'date_sent': msg.date_sent,
-                'to_number': msg.to,
-                'from_number': msg.from_,
-                'status': msg.status.lower() if msg.status else 'unknown',
-                'error_code': msg.error_code,
-                'error_message': msg.error_message,
-                'direction': msg.direction,
-                'price': float(msg.price) if msg.price else 0.0,
-                'body': msg.body
-            }
-            batch.append(record)
-            count += 1
-            
-            # Rate limiting: add small delay every 50 messages
-            if count % 50 == 0:
-                time.sleep(0.1)  # 100ms delay
-            
-            if len(batch) >= batch_size:
-                bulk_upsert(session, batch)
-                batch = []
-                print(f"Synced {count} messages so far...")
-                
-        if batch:
-            bulk_upsert(session, batch)
+        # DateSent filters are date-granular: the SDK serializes both bounds
+        # as YYYY-MM-DD (a datetime is truncated to its date), so slices are
+        # whole UTC calendar days, [d, d + 1), passed as date values. A
+        # minutes_back window therefore starts at 00:00 UTC of its first day.
+        now = datetime.now(timezone.utc)
+        if minutes_back:
+            slices = [((now - timedelta(minutes=minutes_back)).date(), None)]
+            print(f"Starting sync for past {minutes_back} minutes...")
+        else:
+            # Today's slice stays open-ended so messages sent while the sync
+            # runs are still picked up
+            days = [now.date() - timedelta(days=day) for day in range(days_back + 1)]
+            slices = [(d, d + timedelta(days=1) if day else None) for day, d in enumerate(days)]
+            print(f"Starting historical sync for past {days_back} days...")
         
-        print(f"✅ Sync complete: {count} total messages")
+        try:
+            count = 0
+            pool = ThreadPoolExecutor(max_workers=SYNC_WORKERS)
+            try:
+                futures = [pool.submit(sync_time_slice, start, end) for start, end in slices]
+                for future in as_completed(futures):
+                    count += future.result()
+                    print(f"Synced {count} messages so far...")
+            finally:
+                # On failure, drop the slices that haven't started so the
+                # retry isn't held up behind them
+                pool.shutdown(cancel_futures=True)
             
-    except Exception as exc:
-        # If we hit a rate limit (429), SignalWire SDK might raise exception
-        # We can catch and retry the task
-        print(f"Sync Error: {exc}")
-        raise self.retry(exc=exc, countdown=60) # Wait 60s and try again
-    finally:
-        session.close()
+            refresh_all_rollups(since=min(start for start, _ in slices))
+            print(f"✅ Sync complete: {count} total messages")
+            
+        except Exception as exc:
+            # If we hit a rate limit (429), SignalWire SDK might raise exception
+            # We can catch and retry the task
+            print(f"Sync Error: {exc}")
+            raise self.retry(exc=exc, countdown=60) # Wait 60s and try again
+
+@celery.task
+def refresh_rollups():
+    """Keep the hourly counters and the recent days' rollups current"""
+    refresh_all_rollups()
 
-def bulk_upsert(session, records):
+def bulk_upsert(records):
     if not records:
         return
-        
-    stmt = insert(SMSLog).values(records)
-    
-    do_update_stmt = stmt.on_conflict_do_update(
-        index_elements=['id'],
-        set_={
-            'status': stmt.excluded.status,
-            'error_code': stmt.excluded.error_code,
-            'error_message': stmt.excluded.error_message,
-            'price': stmt.excluded.price
-        }
-    )
     
-    session.execute(do_update_stmt)
-    session.commit()
+    copy_upsert(records, ['status', 'error_code', 'error_message', 'price'])
     print(f"Synced batch of {len(records)} records.")
 
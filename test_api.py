@@ -1,24 +1,35 @@
 #!/usr/bin/env python3
 """Test API endpoints locally"""
+import json
+from concurrent.futures import ThreadPoolExecutor
 from app import app
 
-def test_endpoint(client, path):
-    print(f"\n{'='*50}")
-    print(f"Testing: {path}")
-    print('='*50)
-    response = client.get(path)
-    print(f"Status: {response.status_code}")
+PATHS = [
+    '/api/stats/overview',
+    '/api/stats/errors',
+    '/api/stats/optouts',
+    '/api/stats/latency',
+    '/api/logs_dt?draw=1&start=0&length=5',
+]
+
+def probe_endpoint(path):
+    """Request one path and return its report (printed by the caller, so
+    concurrent probes don't interleave their output)"""
+    lines = [f"\n{'='*50}", f"Testing: {path}", '='*50]
+    # A client per probe: the endpoints run concurrently, each on its own
+    # thread and database connection
+    with app.test_client() as client:
+        response = client.get(path)
+    lines.append(f"Status: {response.status_code}")
     data = response.get_json()
     if data:
-        import json
-        print(f"Data: {json.dumps(data, indent=2, default=str)[:500]}...")
+        lines.append(f"Data: {json.dumps(data, indent=2, default=str)[:500]}...")
     else:
-        print("No data returned")
-
-with app.test_client() as client:
-    test_endpoint(client, '/api/stats/overview')
-    test_endpoint(client, '/api/stats/errors')
-    test_endpoint(client, '/api/stats/optouts')
-    test_endpoint(client, '/api/stats/latency')
-    test_endpoint(client, '/api/logs_dt?draw=1&start=0&length=5')
+        lines.append("No data returned")
+    return '\n'.join(lines)
 
+# A script, not a pytest module: nothing runs on import/collection
+if __name__ == '__main__':
+    with ThreadPoolExecutor(max_workers=len(PATHS)) as pool:
+        for report in pool.map(probe_endpoint, PATHS):
+            print(report)
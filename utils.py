@@ -0,0 +1,81 @@
+"""
+Shared helpers for the SignalWire sync and webhook paths
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+_MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+}
+
+# tzinfo per offset string, so each distinct offset is built only once
+_OFFSETS = {'+0000': timezone.utc, '-0000': timezone.utc, 'GMT': timezone.utc, 'UTC': timezone.utc}
+
+def _tzinfo(offset):
+    tzinfo = _OFFSETS.get(offset)
+    if tzinfo is None:
+        sign = -1 if offset[0] == '-' else 1
+        tzinfo = timezone(sign * timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5])))
+        _OFFSETS[offset] = tzinfo
+    return tzinfo
+
+def parse_signalwire_date(date_str):
+    """
+    Parse a SignalWire timestamp to an aware datetime.
+    SignalWire (like Twilio) uses RFC 2822: "Mon, 25 Nov 2024 12:34:56 +0000".
+    That fixed layout is split directly, which avoids the generic
+    email.utils parser on the hot sync path; anything else falls back to
+    email.utils and then ISO 8601.
+    """
+    if not date_str:
+        return None
+    try:
+        _, day, month, year, clock, offset = date_str.split()
+        hour, minute, second = clock.split(':')
+        return datetime(int(year), _MONTHS[month], int(day),
+                        int(hour), int(minute), int(second), tzinfo=_tzinfo(offset))
+    except (ValueError, KeyError, IndexError):
+        pass
+    try:
+        return parsedate_to_datetime(date_str)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: acquire() takes one token, sleeping only for
+    the time until the next one refills. Lets callers use the whole request
+    budget instead of a fixed sleep per page, while bursts stay capped.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                # Waiters queue on the lock, so each sleeps its own slot
+                time.sleep((1 - self.tokens) / self.rate)
+                self.updated = time.monotonic()
+                self.tokens = 0
+            else:
+                self.tokens -= 1
+
+# Shared by every SignalWire API caller in the process (SignalWire allows
+# roughly 10 requests/second per project)
+SIGNALWIRE_RPS = float(os.getenv('SIGNALWIRE_REQUESTS_PER_SECOND', 10))
+signalwire_rate = TokenBucket(rate=SIGNALWIRE_RPS, burst=max(1, int(SIGNALWIRE_RPS)))